@@ -1,30 +1,82 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, JWTManager
 from config import Config
-from .routes.users_routes import users_bp
-from .routes.authentication_routes import auth_bp, BLACKLIST
-from .routes.purchase_logs_routes import purchase_logs_bp
-from .routes.tasks_routes import tasks_bp
-from .routes.raw_materials_routes import raw_materials_bp
-from .routes.receipt_routes import receipts_bp
-from .db import Base,engine
+from .db import db_session, engine, init_app as init_db
+from .db.pagination import InvalidPageRequest
+from .db.schema import schema_cli, sync_schema
+from .web.json_provider import FastJSONProvider
+from .web.caching import init_app as init_response_cache
+from .services.rollups import rollups_cli
+from .services.search import search_cli
+from .services.name_index import init_app as init_name_index
+from .services.token_blocklist import init_app as init_token_blocklist, token_blocklist
+from .services.passwords import HashingBusy, init_app as init_password_hasher
+from .services.identities import init_app as init_identity_cache, user_by_id
+from .services.storage import init_app as init_storage
+from .services.thumbnails import init_app as init_thumbnails, thumbnails_cli
+from .services.jobs import init_app as init_jobs, jobs_cli
 
 
 def create_app():
 
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.json = FastJSONProvider(app)
     CORS(app, resources={r"/api/*": {"origins": ["http://localhost:8081", "http://localhost"]}}, supports_credentials=True)
     jwt = JWTManager(app)
+    init_db(app)
+    init_response_cache(app)
 
 
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
         jti = jwt_payload["jti"]
-        return jti in BLACKLIST
-    Base.metadata.create_all(bind=engine)
-    
+        return token_blocklist.is_revoked(jti)
+
+    @jwt.user_lookup_loader
+    def load_current_user(jwt_header, jwt_payload):
+        # one cached lookup per request; a deleted user's tokens stop working
+        return user_by_id(db_session, jwt_payload["sub"])
+    sync_schema(engine)
+    init_name_index(app)
+    init_token_blocklist(app)
+    init_password_hasher(app)
+    init_identity_cache(app)
+    init_storage(app)
+    init_thumbnails(app)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(thumbnails_cli)
+    app.cli.add_command(jobs_cli)
+
+    @app.errorhandler(InvalidPageRequest)
+    def handle_invalid_page_request(e):
+        return jsonify({"msg": str(e)}), 400
+
+    @app.errorhandler(HashingBusy)
+    def handle_hashing_busy(e):
+        return jsonify({"msg": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+    register_blueprints(app)
+    init_jobs(app)
+
+    return app
+
+
+def register_blueprints(app):
+    # imported here rather than at module level so that importing the package
+    # (CLI helpers, job workers, benchmarks) does not pull in every route module
+    from .routes.users_routes import users_bp
+    from .routes.authentication_routes import auth_bp
+    from .routes.purchase_logs_routes import purchase_logs_bp
+    from .routes.tasks_routes import tasks_bp
+    from .routes.raw_materials_routes import raw_materials_bp
+    from .routes.receipt_routes import receipts_bp
+    from .routes.metrics_routes import metrics_bp
+    from .routes.search_routes import search_bp
+
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     # app.register_blueprint(fields_bp, url_prefix='/api/fields')
     # app.register_blueprint(inventories_bp, url_prefix='/api/inventories')
@@ -38,8 +90,7 @@ def create_app():
     # app.register_blueprint(recipes_bp, url_prefix='/api/recipes')
     app.register_blueprint(receipts_bp, url_prefix='/api/receipts')
     app.register_blueprint(users_bp, url_prefix='/api/users')
-
-
-    return app
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
 
 
@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm import declarative_base
 from config import Config
 # import sys
@@ -20,12 +21,73 @@ from config import Config
 
 # engine = create_engine(f"sqlite:///{db_path}")
 
-engine = create_engine(Config.DATABASE_URL, echo=True, future=True)
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _set_sqlite_pragmas(config):
+    """Return a connect listener that applies the configured pragmas."""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        # negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(config.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+        cursor.close()
+    return on_connect
+
+
+def create_engine_from_config(config=Config):
+    """Build the engine from a Config-like object.
+
+    SQLite file databases get WAL, a busy timeout and a sized QueuePool so
+    concurrent writers wait on each other instead of failing with
+    "database is locked".
+    """
+    url = make_url(config.DATABASE_URL)
+    options = {"echo": config.SQLALCHEMY_ECHO, "future": True}
+
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {
+            "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            "check_same_thread": False,
+        }
+
+    new_engine = create_engine(url, **options)
+
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine, "connect", _set_sqlite_pragmas(config))
+
+    return new_engine
+
+
+engine = create_engine_from_config(Config)
 
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-db_session = SessionLocal()
+
+# Request-scoped session: every use inside one app context shares a session,
+# which is closed and handed back to the pool by the teardown hook below.
+db_session = scoped_session(SessionLocal)
 
 Base = declarative_base()
 
 
+def init_app(app):
+    @app.teardown_appcontext
+    def remove_db_session(exception=None):
+        if exception is not None:
+            db_session.rollback()
+        db_session.remove()
@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import DateTime, and_, or_, tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Opaque cursor for the last row of a page."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, order_columns):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != len(order_columns):
+        raise InvalidPageRequest("Invalid cursor")
+
+    decoded = []
+    for column, value in zip(order_columns, values):
+        if value is not None and isinstance(column.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise InvalidPageRequest("Invalid cursor")
+        decoded.append(value)
+    return decoded
+
+
+def encode_offset(offset):
+    """Cursor for result sets ordered by a score, where keyset paging does not apply."""
+    return encode_cursor([offset])
+
+
+def decode_offset(token):
+    if not token:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        (offset,) = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidPageRequest("Invalid cursor")
+    return offset
+
+
+def page_params():
+    """Read ``limit`` and ``cursor`` from the query string."""
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1:
+        raise InvalidPageRequest("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE), request.args.get("cursor") or None
+
+
+def _after_null_aware(order_columns, values):
+    """``order_columns`` after ``values`` in NULLS FIRST order, with NULLs in the cursor.
+
+    Expands the row-value comparison column by column, since ``col > NULL``
+    matches nothing: a NULL is followed by every non-NULL value.
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(order_columns, values)):
+        equal = [c.is_(None) if v is None else c == v for c, v in zip(order_columns[:i], values[:i])]
+        greater = column.is_not(None) if value is None else column > value
+        clauses.append(and_(*equal, greater))
+    return or_(*clauses)
+
+
+def apply_keyset(stmt, order_columns, cursor=None, limit=None):
+    """Order ``stmt`` by ``order_columns`` and resume after ``cursor``.
+
+    The last column must be unique (normally the primary key) so that the
+    row-value comparison ``(a, b) > (:a, :b)`` never skips or repeats rows.
+    Earlier columns may be nullable: NULLs sort first, and a cursor taken on
+    a NULL row resumes with the rest of the NULLs and then the values.
+    """
+    if cursor:
+        values = decode_cursor(cursor, order_columns)
+        if None in values:
+            stmt = stmt.where(_after_null_aware(order_columns, values))
+        elif len(order_columns) == 1:
+            stmt = stmt.where(order_columns[0] > values[0])
+        else:
+            # a NULL in a later column compares as unknown, which correctly
+            # excludes it: NULLs sort before any value already passed
+            stmt = stmt.where(tuple_(*order_columns) > tuple_(*values))
+
+    stmt = stmt.order_by(*(column.asc().nulls_first() for column in order_columns))
+    if limit is not None:
+        # one extra row tells us whether there is a next page
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def fetch_page(session, stmt, *order_columns, scalars=True):
+    """Run one keyset page of ``stmt``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    limit, cursor = page_params()
+    stmt = apply_keyset(stmt, order_columns, cursor, limit)
+
+    result = session.execute(stmt)
+    rows = result.scalars().all() if scalars else result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in order_columns])
+    return rows, next_cursor
@@ -0,0 +1,192 @@
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, inspect, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from . import Base
+from .. import models  # noqa: F401  (registers the tables on Base.metadata)
+from ..dates import parse_datetime
+from ..models import RawMaterialPurchaseLog, SchemaMeta, TokenBlocklist
+from ..services import search  # noqa: F401  (FTS table and triggers, created after the tables)
+from ..services.name_index import backfill_normalized_names
+from ..services.rollups import rebuild_rollups
+from ..services.time_rollups import rebuild_task_time_buckets
+
+# Bump whenever a model, index or data migration changes. sync_schema skips
+# all of its checks when the database already records this version.
+SCHEMA_VERSION = 7
+SCHEMA_VERSION_KEY = "schema_version"
+
+
+def add_missing_columns(bind):
+    """``ALTER TABLE ... ADD COLUMN`` for model columns an existing table lacks.
+
+    Only nullable columns without server-side constraints can be added this
+    way, which is all the schema has grown so far.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    preparer = bind.dialect.identifier_preparer
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    definition = CreateColumn(column).compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {definition}"))
+                    added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def _convert_purchase_log_dates(connection):
+    """Rewrite ``log_date``/``purchase_date`` in SQLAlchemy's DateTime format.
+
+    Both columns used to be declared as strings and hold whatever the
+    writer produced (``str(datetime)``, ISO-8601 with ``T``/``Z``, plain
+    dates). The typed column needs one fixed-width format so that reads
+    parse and range comparisons sort correctly. Values that do not parse
+    are cleared.
+    """
+    table = RawMaterialPurchaseLog.__table__
+    rows = connection.execute(text(
+        "SELECT id, log_date, purchase_date FROM raw_material_purchase_logs"
+        " WHERE log_date IS NOT NULL OR purchase_date IS NOT NULL"
+    )).all()
+
+    def convert(value):
+        if value is None:
+            return None
+        try:
+            return parse_datetime(value)
+        except ValueError:
+            return None
+
+    if rows:
+        connection.execute(
+            update(table).where(table.c.id == bindparam("b_id")).values(
+                log_date=bindparam("b_log_date"), purchase_date=bindparam("b_purchase_date")
+            ),
+            [
+                {"b_id": row_id, "b_log_date": convert(log_date), "b_purchase_date": convert(purchase_date)}
+                for row_id, log_date, purchase_date in rows
+            ],
+        )
+
+
+def _backfill_rollups(connection):
+    """Fill the spend rollups from the purchase logs that predate them.
+
+    They are only kept up to date from writes made after they were created,
+    so on an existing database they would otherwise start out empty.
+    """
+    with Session(bind=connection) as session:
+        rebuild_rollups(session)
+        session.flush()
+
+
+def _backfill_task_time_buckets(connection):
+    """Fill the task time buckets from the tasks that predate them, like ``_backfill_rollups``."""
+    with Session(bind=connection) as session:
+        rebuild_task_time_buckets(session)
+        session.flush()
+
+
+def _token_blocklist_autoincrement(connection):
+    """Rebuild ``token_blocklist`` with AUTOINCREMENT ids.
+
+    SQLite cannot change a primary key in place, so the rows are copied into
+    a fresh table. Databases created after the change already have it.
+    """
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": TokenBlocklist.__tablename__},
+    ).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    connection.execute(text("ALTER TABLE token_blocklist RENAME TO token_blocklist_old"))
+    for (index_name,) in connection.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'token_blocklist_old' AND sql IS NOT NULL"
+    )).all():
+        connection.execute(text(f'DROP INDEX "{index_name}"'))
+    TokenBlocklist.__table__.create(connection)
+    connection.execute(text(
+        "INSERT INTO token_blocklist (id, jti, expires_at, created_at)"
+        " SELECT id, jti, expires_at, created_at FROM token_blocklist_old ORDER BY id"
+    ))
+    connection.execute(text("DROP TABLE token_blocklist_old"))
+
+
+# applied once each, in order, and recorded in schema_meta
+DATA_MIGRATIONS = (
+    ("migration:purchase_log_dates_to_datetime", _convert_purchase_log_dates),
+    ("migration:backfill_rollups", _backfill_rollups),
+    ("migration:token_blocklist_autoincrement", _token_blocklist_autoincrement),
+    ("migration:backfill_task_time_buckets", _backfill_task_time_buckets),
+)
+
+
+def run_data_migrations(bind):
+    with bind.begin() as connection:
+        applied = set(connection.execute(select(SchemaMeta.key)).scalars())
+    for key, migrate in DATA_MIGRATIONS:
+        if key in applied:
+            continue
+        with bind.begin() as connection:
+            migrate(connection)
+            connection.execute(SchemaMeta.__table__.insert().values(key=key, value=datetime.now().isoformat()))
+
+
+def recorded_schema_version(bind):
+    if not inspect(bind).has_table(SchemaMeta.__tablename__):
+        return None
+    with bind.connect() as connection:
+        return connection.execute(
+            select(SchemaMeta.value).where(SchemaMeta.key == SCHEMA_VERSION_KEY)
+        ).scalar()
+
+
+def sync_schema(bind, force=False):
+    """Create missing tables, columns and indexes, then run pending data migrations.
+
+    ``create_all`` skips tables that already exist, including any column or
+    index that was added to them later, so those are checked one by one.
+    All of that is skipped (one lookup instead) once the database records
+    the current SCHEMA_VERSION. Returns True if the checks ran.
+    """
+    if not force and recorded_schema_version(bind) == str(SCHEMA_VERSION):
+        return False
+
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    backfill_normalized_names(bind)
+    run_data_migrations(bind)
+
+    with bind.begin() as connection:
+        connection.execute(
+            insert(SchemaMeta.__table__)
+            .values(key=SCHEMA_VERSION_KEY, value=str(SCHEMA_VERSION))
+            .on_conflict_do_update(index_elements=["key"], set_={"value": str(SCHEMA_VERSION)})
+        )
+    return True
+
+
+schema_cli = AppGroup("schema", help="Database schema maintenance.")
+
+
+@schema_cli.command("sync")
+def sync_command():
+    """Re-run every schema check, even if SCHEMA_VERSION is already recorded."""
+    from . import engine
+
+    sync_schema(engine, force=True)
+    click.echo(f"Schema synced (version {SCHEMA_VERSION}).")
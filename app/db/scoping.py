@@ -0,0 +1,63 @@
+from flask import request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from ..dates import parse_datetime
+from .pagination import InvalidPageRequest
+
+
+def current_user_id():
+    return int(get_jwt_identity())
+
+
+def wants_all_users():
+    """Admins may opt out of per-user scoping with ``?scope=all``."""
+    return request.args.get("scope") == "all" and bool(get_jwt().get("is_admin"))
+
+
+def owned_by_current_user(stmt, model):
+    """Restrict a select()/Query over ``model`` to the caller's rows."""
+    if wants_all_users():
+        return stmt
+    return stmt.where(model.user_id == current_user_id())
+
+
+def requested_owner_id():
+    """Owner filter for exports: the caller, or for admins ``?user_id=`` / all (None)."""
+    if get_jwt().get("is_admin"):
+        value = request.args.get("user_id")
+        if value:
+            try:
+                return int(value)
+            except ValueError:
+                raise InvalidPageRequest(f"Invalid 'user_id': {value}")
+        if request.args.get("scope") == "all":
+            return None
+    return current_user_id()
+
+
+def date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return parse_datetime(value)
+    except ValueError:
+        raise InvalidPageRequest(f"Invalid '{name}' date: {value}")
+
+
+def requested_date_range():
+    """``(date_from, date_to)`` from ``?from=`` / ``?to=``; ``to`` is exclusive."""
+    return date_arg("from"), date_arg("to")
+
+
+def owned_within_dates(column_name, date_from, date_to):
+    """Scope like ``owned_by_current_user``, also limited to ``[date_from, date_to)`` on ``column_name``."""
+    def scope(stmt, model):
+        stmt = owned_by_current_user(stmt, model)
+        column = getattr(model, column_name)
+        if date_from is not None:
+            stmt = stmt.where(column >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(column < date_to)
+        return stmt
+    return scope
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Boolean, DateTime
+from sqlalchemy.orm import declarative_base, relationship, validates
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Boolean, DateTime, Index
 from datetime import datetime
 from ..db import Base
+from ..names import normalize_name
 
 
 
@@ -58,6 +59,7 @@ class RawMaterial(Base):
     __tablename__= 'raw_materials'
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String)
+    normalized_name = Column(String, index=True)
     category = Column(String)
     subcategory = Column(String)
     created_at = Column(DateTime)
@@ -72,6 +74,10 @@ class RawMaterial(Base):
 
     # product_recipe_item_links = relationship("ProductRecipeItemLink", back_populates="item")
 
+    @validates('name')
+    def _set_normalized_name(self, key, value):
+        self.normalized_name = normalize_name(value)
+        return value
 
     def to_dict(self):
         return{
@@ -106,6 +112,7 @@ class Vendor(Base):
     __tablename__ = 'vendors'
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String)
+    normalized_name = Column(String, index=True)
     phone = Column(String)
     email = Column(String)
     website = Column(String)
@@ -119,6 +126,11 @@ class Vendor(Base):
 
     receipts = relationship('ReceiptEntry', back_populates='vendor')
 
+    @validates('name')
+    def _set_normalized_name(self, key, value):
+        self.normalized_name = normalize_name(value)
+        return value
+
     def to_dict(self):
         return{
             'id': self.id,
@@ -146,10 +158,15 @@ class Vendor(Base):
 
 class RawMaterialPurchaseLog(Base):
     __tablename__ = 'raw_material_purchase_logs'
+    __table_args__ = (
+        Index('ix_raw_material_purchase_logs_user_id_id', 'user_id', 'id'),
+        Index('ix_raw_material_purchase_logs_user_id_purchase_date', 'user_id', 'purchase_date'),
+        Index('ix_raw_material_purchase_logs_purchase_date', 'purchase_date'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     brand = Column(String)
-    log_date = Column(String)
-    purchase_date = Column(String)
+    log_date = Column(DateTime)
+    purchase_date = Column(DateTime)
     purchase_amount = Column(Float)
     purchase_unit = Column(String)
     cost = Column(Float)
@@ -433,6 +450,10 @@ class RawMaterialInventoryLog(Base):
     
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_start_datetime_id', 'start_datetime', 'id'),
+        Index('ix_tasks_user_id_start_datetime_id', 'user_id', 'start_datetime', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String)
@@ -660,11 +681,18 @@ class Task(Base):
 
 class ReceiptEntry(Base):
     __tablename__ = "receipt_entries"
+    __table_args__ = (
+        Index('ix_receipt_entries_user_id_date', 'user_id', 'date'),
+        Index('ix_receipt_entries_date', 'date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     date = Column(DateTime)
     image_url = Column(String)
     filename = Column(String)
+    # downscaled previews, filled in by the thumbnail pipeline after upload
+    thumbnail_url = Column(String)
+    thumbnail_jpeg_url = Column(String)
     created_at = Column(DateTime)
     memo = Column(String)
 
@@ -684,6 +712,8 @@ class ReceiptEntry(Base):
             "date": self.date,
             "image_url": self.image_url,
             "filename": self.filename,
+            "thumbnail_url": self.thumbnail_url,
+            "thumbnail_jpeg_url": self.thumbnail_jpeg_url,
             "created_at": self.created_at,
             "memo": self.memo,
             "vendor_id": self.vendor_id,
@@ -701,3 +731,165 @@ class ReceiptEntry(Base):
     
     # def get_purchase_log(self):
       
+
+
+class TableVersion(Base):
+    __tablename__ = 'table_versions'
+
+    # user_id 0 is the whole-table counter; other rows count one user's writes
+    table_name = Column(String, primary_key=True)
+    user_id = Column(Integer, primary_key=True, default=0)
+    version = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'table_name': self.table_name,
+            'user_id': self.user_id,
+            'version': self.version,
+        }
+
+
+class MaterialSpendRollup(Base):
+    __tablename__ = 'material_spend_rollups'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    item_id = Column(Integer, ForeignKey('raw_materials.id'), primary_key=True)
+    purchase_unit = Column(String, primary_key=True, default='')
+    total_cost = Column(Float, nullable=False, default=0)
+    total_quantity = Column(Float, nullable=False, default=0)
+    purchase_count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'item_id': self.item_id,
+            'purchase_unit': self.purchase_unit,
+            'total_cost': self.total_cost,
+            'total_quantity': self.total_quantity,
+            'purchase_count': self.purchase_count,
+        }
+
+
+class VendorSpendRollup(Base):
+    __tablename__ = 'vendor_spend_rollups'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    vendor_id = Column(Integer, ForeignKey('vendors.id'), primary_key=True)
+    total_cost = Column(Float, nullable=False, default=0)
+    purchase_count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'vendor_id': self.vendor_id,
+            'total_cost': self.total_cost,
+            'purchase_count': self.purchase_count,
+        }
+
+
+class MonthlySpendRollup(Base):
+    __tablename__ = 'monthly_spend_rollups'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM of purchase_date
+    total_cost = Column(Float, nullable=False, default=0)
+    purchase_count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'month': self.month,
+            'total_cost': self.total_cost,
+            'purchase_count': self.purchase_count,
+        }
+
+
+class TaskTimeBucket(Base):
+    __tablename__ = 'task_time_buckets'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    granularity = Column(String(5), primary_key=True)  # day | week | month
+    bucket_start = Column(DateTime, primary_key=True)
+    total_seconds = Column(Float, nullable=False, default=0)
+    task_count = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'granularity': self.granularity,
+            'bucket_start': self.bucket_start,
+            'total_seconds': self.total_seconds,
+            'task_count': self.task_count,
+        }
+
+
+class SchemaMeta(Base):
+    __tablename__ = 'schema_meta'
+
+    # one row per applied data migration (and other schema bookkeeping)
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'value': self.value,
+        }
+
+
+class TokenBlocklist(Base):
+    __tablename__ = 'token_blocklist'
+    # without AUTOINCREMENT SQLite reuses the ids of pruned rows, which
+    # workers that already saw those ids would never fetch
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # id orders revocations so each worker can fetch only the ones it has not seen
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jti = Column(String(36), nullable=False, unique=True)
+    expires_at = Column(DateTime, index=True)  # token expiry (naive UTC); NULL never expires
+    created_at = Column(DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'jti': self.jti,
+            'expires_at': self.expires_at,
+            'created_at': self.created_at,
+        }
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # workers claim the oldest due job of a status
+        Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    payload = Column(String)  # JSON
+    status = Column(String, nullable=False, default='queued')  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False)  # naive UTC; not claimed before this
+    locked_by = Column(String)
+    locked_until = Column(DateTime)  # lease end; an expired lease makes the job claimable again
+    last_error = Column(String)
+    result = Column(String)  # JSON the handler reported for its latest attempt
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at,
+            'locked_by': self.locked_by,
+            'locked_until': self.locked_until,
+            'last_error': self.last_error,
+            'result': self.result,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
@@ -0,0 +1,27 @@
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_name(value):
+    """Canonical form used to match vendor and material names.
+
+    Case, accents, punctuation and runs of whitespace are ignored, so
+    "Gypsum", "gypsum " and "GYPSUM." all normalize to ``"gypsum"``.
+    """
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace("'", "").replace("’", "")
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def trigrams(normalized):
+    """Set of word trigrams, each word padded as ``"  word "`` (as pg_trgm does)."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
@@ -1,32 +1,45 @@
 from flask import request, jsonify, Blueprint
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime
 from ..models import User, Task
-from ..db import SessionLocal
+from ..db import db_session
+from ..services.identities import invalidate_user, user_by_username
+from ..services.passwords import HashingBusy, password_hasher
+from ..services.token_blocklist import expiry_of, token_blocklist
 
 auth_bp = Blueprint('authentication', __name__)
 
 def get_user_by_username(username):
-    db_session = SessionLocal()
-    user = db_session.query(User).filter_by(username=username).first()
-    db_session.close()
-    if user:
-        # return consistent keys
-        return {
-            "id": user.id,
-            "username": user.username,
-            "password_hash": user.password_hash,
-            "is_admin": user.is_admin
-        }
-    return None
+    return user_by_username(db_session, username)
 
 
 
 def check_password(user, password):
     if not user or "password_hash" not in user:
         return False
-    return check_password_hash(user["password_hash"], password)
+    return password_hasher.verify(user["password_hash"], password)
+
+
+def upgrade_password_hash(user, password):
+    """Re-hash with the current PASSWORD_HASH_METHOD after a successful login, if it changed."""
+    try:
+        if not password_hasher.needs_rehash(user["password_hash"]):
+            return
+        password_hash = password_hasher.hash(password)
+    except HashingBusy:
+        return  # not worth failing the login over; next time
+    db_session.query(User).filter_by(id=user["id"]).update({"password_hash": password_hash})
+    db_session.commit()
+    invalidate_user(user["id"])
+
+
+def issue_tokens(user_id, is_admin):
+    """Access + refresh token pair; the admin claim travels with both."""
+    additional_claims = {"is_admin": True} if is_admin else None
+    return {
+        'access_token': create_access_token(identity=str(user_id), additional_claims=additional_claims),
+        'refresh_token': create_refresh_token(identity=str(user_id), additional_claims=additional_claims),
+    }
 
 
 @auth_bp.route("/login", methods=['POST'])
@@ -34,20 +47,43 @@ def login():
     data = request.get_json()
     user = get_user_by_username(data['username'])
     if user and check_password(user, data['password']):
-        if user['is_admin']:
-            additional_claims = {"is_admin": True}
-            access_token = create_access_token(identity=str(user['id']), additional_claims=additional_claims)
-        access_token = create_access_token(identity=str(user['id']))
+        upgrade_password_hash(user, data['password'])
+        tokens = issue_tokens(user['id'], user['is_admin'])
 
         user_data = {"id": user["id"], "username": user["username"]}
-        return jsonify({'access_token': access_token, 'user': user_data}), 200
+        return jsonify({**tokens, 'user': user_data}), 200
     return jsonify({"msg": "Bad username or password"}), 401
 
-BLACKLIST = set()
+@auth_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    """Trade a refresh token for a new access + refresh pair; the old refresh token is revoked."""
+    token = get_jwt()
+    if not token_blocklist.revoke(db_session, token["jti"], expiry_of(token)):
+        # a concurrent request already rotated this token
+        db_session.rollback()
+        return jsonify({"msg": "Token has been revoked"}), 401
+    db_session.commit()
+    return jsonify(issue_tokens(get_jwt_identity(), token.get("is_admin"))), 200
 
 @auth_bp.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
-    jti = get_jwt()["jti"]
-    BLACKLIST.add(jti)
+    """Revoke the access token, and the refresh token too when sent as ``refresh_token``."""
+    token = get_jwt()
+
+    revoked = [token]
+    refresh_token = (request.get_json(silent=True) or {}).get("refresh_token")
+    if refresh_token:
+        try:
+            refresh_payload = decode_token(refresh_token, allow_expired=True)
+        except Exception:
+            return jsonify({"msg": "Invalid refresh_token"}), 400
+        if refresh_payload.get("type") != "refresh" or refresh_payload.get("sub") != token["sub"]:
+            return jsonify({"msg": "Invalid refresh_token"}), 400
+        revoked.append(refresh_payload)
+
+    for payload in revoked:
+        token_blocklist.revoke(db_session, payload["jti"], expiry_of(payload))
+    db_session.commit()
     return jsonify(msg="Successfully logged out"), 200
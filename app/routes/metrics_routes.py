@@ -0,0 +1,19 @@
+from flask import jsonify, Blueprint
+from flask_jwt_extended import get_jwt, jwt_required
+from ..services.cache import response_cache
+from ..services.identities import identity_cache
+from ..services.jobs import job_queue
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route("/", methods=["GET"])
+@jwt_required()
+def get_metrics():
+    if not get_jwt().get("is_admin"):
+        return jsonify({"msg": "Admins only"}), 403
+
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'identity_cache': identity_cache.stats(),
+        'jobs': job_queue.stats(),
+    }), 200
@@ -1,164 +1,294 @@
-from flask import request, jsonify, Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import current_app, request, jsonify, Blueprint
+from flask_jwt_extended import jwt_required
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 from ..models import RawMaterialPurchaseLog, RawMaterial, RawMaterialInventoryLog, Vendor, ReceiptEntry
-from ..db import SessionLocal
+from ..models import MaterialSpendRollup, VendorSpendRollup, MonthlySpendRollup
+from sqlalchemy import func, select
+from ..dates import parse_datetime
+from ..db import db_session
+from ..db.projection import fetch_projected_page
+from ..db.scoping import current_user_id, owned_by_current_user, owned_within_dates, requested_date_range, wants_all_users
+from ..names import normalize_name
+from ..services.analytics import BUCKETS, AnalyticsUnavailable, load_purchase_columns, spend_analytics
+from ..services.exports import purchase_logs_export
+from ..services.name_index import suggest as suggest_names
+from ..services.purchase_imports import InvalidImport, clean_rows, import_purchases, rows_from_csv
+from ..web.caching import cached_get
+from ..web.exports import export_filters, export_response
+from ..web.streaming import stream_collection, wants_stream
 
 purchase_logs_bp = Blueprint('purchase_logs', __name__)
 
 @purchase_logs_bp.route("/raw-materials", methods=["GET"])
 @jwt_required()
+@cached_get('raw_material_purchase_logs', per_user=True)
 def list_raw_material_purchase_logs():
-    with SessionLocal() as db_session:
+    """The caller's purchase logs; ``from``/``to`` narrow (and order) them by purchase date."""
+    date_from, date_to = requested_date_range()
+    if date_from is None and date_to is None:
+        order_columns = (RawMaterialPurchaseLog.id,)
+    else:
+        # walks the (user_id, purchase_date) index as a range scan
+        order_columns = (RawMaterialPurchaseLog.purchase_date, RawMaterialPurchaseLog.id)
+    scope = owned_within_dates('purchase_date', date_from, date_to)
 
-        raw_material_purchase_logs = db_session.query(RawMaterialPurchaseLog).all()
+    if wants_stream():
+        return stream_collection('raw_material_purchase_logs', RawMaterialPurchaseLog, *order_columns, scope=scope)
 
-        raw_material_purchase_logs_serialized = [r.to_dict() for r in raw_material_purchase_logs]
+    raw_material_purchase_logs_serialized, next_cursor = fetch_projected_page(
+        db_session, RawMaterialPurchaseLog, *order_columns, scope=scope
+    )
 
+    return jsonify({
+        'raw_material_purchase_logs': raw_material_purchase_logs_serialized,
+        'next_cursor': next_cursor
+    }), 200
 
-        return jsonify({'raw_material_purchase_logs': raw_material_purchase_logs_serialized}), 200
 @purchase_logs_bp.route("/raw-materials", methods=["POST"])
 @jwt_required()
 def register_raw_material_purchase_log():
-    with SessionLocal() as db_session:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-
-        name = data['name']
-        brand = data['brand']
-        purchase_date = datetime.strptime(data['purchaseDate'], "%Y-%m-%dT%H:%M:%S.%fZ")
-        purchase_quantity = data['purchaseQuantity']
-        purchase_unit = data['purchaseUnit']
-        inventory_quantity = data['inventoryQuantity']
-        inventory_unit = data['inventoryUnit']
-        cost = data['cost']
-        notes = data['notes']
-
-        vendor_name = data['vendor']
-        vendor = db_session.query(Vendor).filter_by(name=vendor_name).first()
-        if not vendor:
-            vendor = Vendor(
-                name=vendor_name,
-                phone=data['vendorPhone'],
-                email=data['vendorEmail'],
-                website=data['vendorWebsite']
-            )
-            db_session.add(vendor)
-            db_session.flush() 
-
-        raw_material = db_session.query(RawMaterial).filter_by(name=name).first()
-        if not raw_material:
-            raw_material = RawMaterial(
-                name=name,
-                category=data['category'],
-                subcategory=data['subcategory'],
-                created_at=datetime.now()
-            )
-            inventory_log = RawMaterialInventoryLog(
-                amount_on_hand=inventory_quantity,
-                amount_on_hand_unit=inventory_unit,
-                created_at=datetime.now(),
-                last_updated=datetime.now()
-            )
-            raw_material.inventory_log = inventory_log
-            db_session.add(raw_material)
-            db_session.flush()
-        else:
-            inventory_log = raw_material.get_inventory_log()
-            if inventory_log:
-                inventory_log.amount_on_hand = (inventory_log.amount_on_hand or 0) + inventory_quantity
-                inventory_log.last_updated = datetime.now()
-
-        purchase_log = RawMaterialPurchaseLog(
-            brand=brand,
-            log_date=datetime.now(),
-            purchase_date=purchase_date,
-            purchase_amount=purchase_quantity,
-            purchase_unit=purchase_unit,
-            cost=cost,
-            notes=notes,
-            item=raw_material,
-            vendor=vendor,
-            inventory_log=inventory_log,
-            user_id=user_id
+    user_id = current_user_id()
+    data = request.get_json()
+
+    name = data['name'].strip()
+    brand = data['brand']
+    try:
+        purchase_date = parse_datetime(data['purchaseDate'])
+    except ValueError:
+        return jsonify({"msg": f"Invalid purchaseDate: {data['purchaseDate']}"}), 400
+    purchase_quantity = data['purchaseQuantity']
+    purchase_unit = data['purchaseUnit']
+    inventory_quantity = data['inventoryQuantity']
+    inventory_unit = data['inventoryUnit']
+    cost = data['cost']
+    notes = data['notes']
+
+    did_you_mean = {}
+
+    vendor_name = data['vendor'].strip()
+    vendor = db_session.query(Vendor).filter_by(normalized_name=normalize_name(vendor_name)).first()
+    if not vendor:
+        did_you_mean['vendor'] = suggest_names('vendor', vendor_name)
+        vendor = Vendor(
+            name=vendor_name,
+            phone=data['vendorPhone'],
+            email=data['vendorEmail'],
+            website=data['vendorWebsite']
         )
-        db_session.add(purchase_log)
-        db_session.flush()
+        db_session.add(vendor)
+        db_session.flush() 
 
-        receipt = ReceiptEntry(
-            date=purchase_date,
-            filename=data['filename'],
-            image_url=data['imageUrl'],
+    raw_material = db_session.query(RawMaterial).filter_by(normalized_name=normalize_name(name)).first()
+    if not raw_material:
+        did_you_mean['raw_material'] = suggest_names('raw_material', name)
+        raw_material = RawMaterial(
+            name=name,
+            category=data['category'],
+            subcategory=data['subcategory'],
+            created_at=datetime.now()
+        )
+        inventory_log = RawMaterialInventoryLog(
+            amount_on_hand=inventory_quantity,
+            amount_on_hand_unit=inventory_unit,
             created_at=datetime.now(),
-            memo=data['receiptMemo'],
-            raw_material_purchase_log=purchase_log,
-            vendor=vendor,
-            user_id=user_id
+            last_updated=datetime.now()
         )
-        db_session.add(receipt)
-        db_session.commit()
+        raw_material.inventory_log = inventory_log
+        db_session.add(raw_material)
+        db_session.flush()
+    else:
+        inventory_log = raw_material.get_inventory_log()
+        if inventory_log:
+            inventory_log.amount_on_hand = (inventory_log.amount_on_hand or 0) + inventory_quantity
+            inventory_log.last_updated = datetime.now()
+
+    receipt = ReceiptEntry(
+        date=purchase_date,
+        filename=data['filename'],
+        image_url=data['imageUrl'],
+        created_at=datetime.now(),
+        memo=data['receiptMemo'],
+        vendor=vendor,
+        user_id=user_id
+    )
+    db_session.add(receipt)
+
+    purchase_log = RawMaterialPurchaseLog(
+        brand=brand,
+        log_date=datetime.now(),
+        purchase_date=purchase_date,
+        purchase_amount=purchase_quantity,
+        purchase_unit=purchase_unit,
+        cost=cost,
+        notes=notes,
+        item=raw_material,
+        vendor=vendor,
+        inventory_log=inventory_log,
+        receipt_entry=receipt,
+        user_id=user_id
+    )
+    db_session.add(purchase_log)
+    db_session.commit()
+
+    response = {"msg": "Purchase Log created"}
+    did_you_mean = {kind: names for kind, names in did_you_mean.items() if names}
+    if did_you_mean:
+        response['did_you_mean'] = did_you_mean
+    return jsonify(response), 201
+
+
+@purchase_logs_bp.route("/raw-materials/bulk", methods=["POST"])
+@jwt_required()
+def import_raw_material_purchase_logs():
+    """Create many purchase logs from a JSON array or an uploaded CSV ``file``."""
+    user_id = current_user_id()
+
+    upload = request.files.get('file')
+    if upload:
+        rows = rows_from_csv(upload.stream)
+    else:
+        data = request.get_json(silent=True)
+        rows = data.get('purchases') if isinstance(data, dict) else data
+
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"msg": "Expected a non-empty list of purchases"}), 400
+    if len(rows) > current_app.config['BULK_IMPORT_MAX_ROWS']:
+        return jsonify({"msg": f"At most {current_app.config['BULK_IMPORT_MAX_ROWS']} purchases per request"}), 413
+
+    try:
+        rows = clean_rows(rows)
+    except InvalidImport as e:
+        return jsonify({"msg": "Invalid purchases", "errors": e.errors}), 400
+
+    summary = import_purchases(db_session, user_id, rows)
+    db_session.commit()
 
-        return jsonify({"msg": "Purchase Log created"}), 201
+    return jsonify({"msg": "Purchase Logs created", **summary}), 201
+
+
+@purchase_logs_bp.route("/raw-materials/export", methods=["GET"])
+@jwt_required()
+def export_raw_material_purchase_logs():
+    owner_id, date_from, date_to = export_filters()
+    return export_response(purchase_logs_export(owner_id, date_from, date_to), 'raw_material_purchase_logs')
+
+
+@purchase_logs_bp.route("/summary", methods=["GET"])
+@jwt_required()
+@cached_get(
+    'raw_material_purchase_logs', 'material_spend_rollups', 'vendor_spend_rollups', 'monthly_spend_rollups',
+    'raw_materials', 'vendors', per_user=True
+)
+def get_purchase_summary():
+    """Spend totals per material, vendor and month, read from the rollup tables."""
+    def totals(model, group_columns, sums, join=None):
+        stmt = select(*group_columns, *(func.sum(model.__table__.c[s]).label(s) for s in sums))
+        if join is not None:
+            stmt = stmt.join(*join)
+        stmt = owned_by_current_user(stmt, model).group_by(*group_columns).order_by(*group_columns)
+        return [dict(row._mapping) for row in db_session.execute(stmt)]
+
+    by_material = totals(
+        MaterialSpendRollup,
+        (MaterialSpendRollup.item_id, RawMaterial.name, MaterialSpendRollup.purchase_unit),
+        ('total_cost', 'total_quantity', 'purchase_count'),
+        join=(RawMaterial, RawMaterial.id == MaterialSpendRollup.item_id)
+    )
+    by_vendor = totals(
+        VendorSpendRollup,
+        (VendorSpendRollup.vendor_id, Vendor.name),
+        ('total_cost', 'purchase_count'),
+        join=(Vendor, Vendor.id == VendorSpendRollup.vendor_id)
+    )
+    by_month = totals(MonthlySpendRollup, (MonthlySpendRollup.month,), ('total_cost', 'purchase_count'))
+
+    return jsonify({'by_material': by_material, 'by_vendor': by_vendor, 'by_month': by_month}), 200
+
+
+@purchase_logs_bp.route("/analytics", methods=["GET"])
+@jwt_required()
+@cached_get('raw_material_purchase_logs', 'raw_materials', per_user=True)
+def get_purchase_analytics():
+    """Time-bucketed spend, unit-cost trends, moving averages and category breakdowns."""
+    bucket = request.args.get('bucket', 'month')
+    window = request.args.get('window', 3, type=int)
+    if bucket not in BUCKETS:
+        return jsonify({"msg": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    if not 1 <= window <= 366:
+        return jsonify({"msg": "window must be between 1 and 366"}), 400
+
+    _, date_from, date_to = export_filters()
+    owner_id = None if wants_all_users() else current_user_id()
+
+    try:
+        columns = load_purchase_columns(db_session, owner_id, date_from, date_to)
+    except AnalyticsUnavailable as e:
+        return jsonify({"msg": str(e)}), 501
+
+    return jsonify(spend_analytics(columns, bucket, window)), 200
 
 
 @purchase_logs_bp.route("/raw-materials/<int:raw_material_purchase_log_id>", methods=["GET"])
 @jwt_required()
+@cached_get('raw_material_purchase_logs', per_user=True)
 def get_raw_material_purchase_log(raw_material_purchase_log_id):
-    with SessionLocal() as db_session:
+    raw_material_purchase_log = owned_by_current_user(
+        db_session.query(RawMaterialPurchaseLog), RawMaterialPurchaseLog
+    ).filter_by(id=raw_material_purchase_log_id).first()
 
-        raw_material_purchase_log = db_session.query(RawMaterialPurchaseLog).filter_by(id=raw_material_purchase_log_id).first()
-
-        if not raw_material_purchase_log:
-            return jsonify({"msg": "Not found"}), 404
-        return jsonify({'raw_material_purchase_log': raw_material_purchase_log.to_dict()})
+    if not raw_material_purchase_log:
+        return jsonify({"msg": "Not found"}), 404
+    return jsonify({'raw_material_purchase_log': raw_material_purchase_log.to_dict()})
 
 @purchase_logs_bp.route("/raw-materials/<int:raw_material_purchase_log_id>", methods=["PUT"])
 @jwt_required()
 def update_raw_material_purchase_log(raw_material_purchase_log_id):
-    with SessionLocal() as db_session:
-        raw_material_purchase_log = db_session.query(RawMaterialPurchaseLog).filter_by(id=raw_material_purchase_log_id).first()
+    raw_material_purchase_log = db_session.query(RawMaterialPurchaseLog).filter_by(
+        id=raw_material_purchase_log_id, user_id=current_user_id()
+    ).first()
 
-        if not raw_material_purchase_log:
-            return jsonify({"msg": "Not found"}), 404
+    if not raw_material_purchase_log:
+        return jsonify({"msg": "Not found"}), 404
 
-        data = request.get_json()
+    data = request.get_json()
 
-        purchase_date = data['purchase_date']
-        purchase_amount = data['purchase_amount']
-        purchase_unit = data['purchase_unit']
-        cost = data['cost']
-        notes = data['notes']
-        item_id = data['item_id']
-        vendor_id = data['vendor_id']
-        raw_material_inventory_log_id = data['raw_material_inventory_log_id']
-            
+    try:
+        purchase_date = parse_datetime(data['purchase_date'])
+    except ValueError:
+        return jsonify({"msg": f"Invalid purchase_date: {data['purchase_date']}"}), 400
+    purchase_amount = data['purchase_amount']
+    purchase_unit = data['purchase_unit']
+    cost = data['cost']
+    notes = data['notes']
+    item_id = data['item_id']
+    vendor_id = data['vendor_id']
+        
 
-        raw_material_purchase_log.purchase_date = purchase_date       #type: ignore
-        raw_material_purchase_log.purchase_amount = purchase_amount       #type: ignore
-        raw_material_purchase_log.purchase_unit = purchase_unit       #type: ignore
-        raw_material_purchase_log.cost = cost       #type: ignore
-        raw_material_purchase_log.notes = notes       #type: ignore
-        raw_material_purchase_log.item_id = item_id       #type: ignore
-        raw_material_purchase_log.vendor_id = vendor_id       #type: ignore
-        raw_material_purchase_log.raw_material_inventory_log_id = raw_material_inventory_log_id       #type: ignore
+    raw_material_purchase_log.purchase_date = purchase_date       #type: ignore
+    raw_material_purchase_log.purchase_amount = purchase_amount       #type: ignore
+    raw_material_purchase_log.purchase_unit = purchase_unit       #type: ignore
+    raw_material_purchase_log.cost = cost       #type: ignore
+    raw_material_purchase_log.notes = notes       #type: ignore
+    raw_material_purchase_log.item_id = item_id       #type: ignore
+    raw_material_purchase_log.vendor_id = vendor_id       #type: ignore
 
-        db_session.commit()
+    db_session.commit()
 
 
-        return jsonify({'success': True}), 200
+    return jsonify({'success': True}), 200
 
 @purchase_logs_bp.route("/raw-materials/<int:raw_material_purchase_log_id>", methods=["DELETE"])
 @jwt_required()
 def delete_raw_material_purchase_log(raw_material_purchase_log_id):
-    with SessionLocal() as db_session:
-
-        raw_material_purchase_log = db_session.query(RawMaterialPurchaseLog).filter_by(id=raw_material_purchase_log_id).first()
+    raw_material_purchase_log = db_session.query(RawMaterialPurchaseLog).filter_by(
+        id=raw_material_purchase_log_id, user_id=current_user_id()
+    ).first()
 
-        if not raw_material_purchase_log:
-            return jsonify({"msg": "Not found"}), 404
+    if not raw_material_purchase_log:
+        return jsonify({"msg": "Not found"}), 404
 
-        db_session.delete(raw_material_purchase_log)
-        db_session.commit()
+    db_session.delete(raw_material_purchase_log)
+    db_session.commit()
 
-        return "", 204
\ No newline at end of file
+    return "", 204
\ No newline at end of file
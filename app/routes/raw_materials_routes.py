@@ -1,88 +1,95 @@
 from flask import jsonify, Blueprint, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from ..db import SessionLocal
+from ..db import db_session
+from ..db.projection import fetch_projected_page
+from ..web.caching import cached_get
+from ..web.streaming import stream_collection, wants_stream
 from ..models import RawMaterial
+from ..names import normalize_name
+from ..services.name_index import suggest as suggest_names
 from datetime import datetime
 
 raw_materials_bp = Blueprint('raw_materials', __name__)
 
 @raw_materials_bp.route("/", methods=["GET"])
 @jwt_required()
+@cached_get('raw_materials')
 def list_raw_materials():
-    db_session = SessionLocal()
+    if wants_stream():
+        return stream_collection('raw_materials', RawMaterial, RawMaterial.id)
 
-    raw_materials = db_session.query(RawMaterial).all()
+    raw_materials_serialized, next_cursor = fetch_projected_page(db_session, RawMaterial, RawMaterial.id)
 
-    raw_materials_serialized = [u.to_dict() for u in raw_materials]
-
-    db_session.close()
-
-    return jsonify({'raw_materials': raw_materials_serialized}), 200
+    return jsonify({'raw_materials': raw_materials_serialized, 'next_cursor': next_cursor}), 200
 
 
 @raw_materials_bp.route("/", methods=["POST"])
 @jwt_required()
 def register_raw_material():
-    db_session = SessionLocal()
     data = request.form
 
-    name = data.get('name')
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({"msg": "Missing name"}), 400
     created_at = datetime.now()
 
-    already_there =  db_session.query(RawMaterial).filter_by(name=name).first()
+    already_there =  db_session.query(RawMaterial).filter_by(normalized_name=normalize_name(name)).first()
 
     if not already_there:
+        did_you_mean = suggest_names('raw_material', name)
         new_item = RawMaterial(
             name = name,
             created_at = created_at
         )
         db_session.add(new_item)
         db_session.commit()
-        db_session.close()
-        return jsonify({"msg": "RawMaterial created"}), 201
+        response = {"msg": "RawMaterial created"}
+        if did_you_mean:
+            response['did_you_mean'] = did_you_mean
+        return jsonify(response), 201
     else:
-        return jsonify({"msg": "RawMaterial already exists"}), 400
+        return jsonify({"msg": "RawMaterial already exists", "raw_material": already_there.to_dict()}), 400
 
 
 @raw_materials_bp.route("/<int:raw_material_id>", methods=["GET"])
 @jwt_required()
+@cached_get('raw_materials')
 def get_raw_material(raw_material_id):
-    db_session = SessionLocal()
-
     raw_material = db_session.query(RawMaterial).filter_by(id=raw_material_id).first()
 
     if raw_material:
-        return jsonify({'raw_material': raw_material})
+        return jsonify({'raw_material': raw_material.to_dict()})
     else:
         return "", 404
 
 @raw_materials_bp.route("/<int:raw_material_id>", methods=["PUT"])
 @jwt_required()
 def update_raw_material(raw_material_id):
-    db_session = SessionLocal()
-    
     data = request.form
 
     name = data.get('name')
 
     raw_material = db_session.query(RawMaterial).filter_by(id=raw_material_id).first()
 
+    if not raw_material:
+        return "", 404
+
     raw_material.name = name       #type: ignore
 
-    db_session.close()
+    db_session.commit()
 
     return jsonify({'success': True}), 200
 
 @raw_materials_bp.route("/<int:raw_material_id>", methods=["DELETE"])
 @jwt_required()
 def delete_raw_material(raw_material_id):
-    db_session = SessionLocal()
-
     raw_material = db_session.query(RawMaterial).filter_by(id=raw_material_id).first()
 
+    if not raw_material:
+        return "", 404
+
     db_session.delete(raw_material)
     db_session.commit()
-    db_session.close()
 
     return "", 204
 
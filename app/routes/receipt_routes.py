@@ -1,28 +1,38 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, current_app, jsonify, request, session, url_for
 from datetime import datetime
 from ..db import db_session
-from ..models import ReceiptEntry, User
-import os
-import boto3
+from ..db.projection import fetch_projected_page
+from ..db.scoping import owned_within_dates, requested_date_range
+from ..models import RawMaterialPurchaseLog, ReceiptEntry, User
+from ..services.exports import receipts_export
+from ..services.jobs import job_status
+from ..services.storage import StorageError, owns_key, queue_deletes, storage
+from ..services.thumbnails import thumbnail_keys
+from ..services.versions import record_write
+from ..web.caching import cached_get
+from ..web.exports import export_filters, export_response
+from ..web.streaming import stream_collection, wants_stream
+import math
+import uuid
+from sqlalchemy import delete, select, update
 from werkzeug.utils import secure_filename
 from flask_login import current_user, login_required
 from flask_jwt_extended  import jwt_required, get_jwt_identity
 
-ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-ACCESS_KEY_ID = os.getenv("CLOUDFLARE_ACCESS_KEY_ID")
-SECRET_ACCESS_KEY = os.getenv("CLOUDFLARE_SECRET_ACCESS_KEY")
-BUCKET_NAME = os.getenv("CLOUDFLARE_BUCKET")
+receipts_bp = Blueprint('receipts', __name__)
 
+# S3 (and R2) limit: part numbers run from 1 to 10,000
+MAX_MULTIPART_PARTS = 10000
 
-receipts_bp = Blueprint('receipts', __name__)
 
-s3_client = boto3.client(
-    "s3",
-    endpoint_url=f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com",
-    aws_access_key_id=ACCESS_KEY_ID,
-    aws_secret_access_key=SECRET_ACCESS_KEY,
-    region_name="auto",
-)
+def new_object_key(user_id, filename):
+    """Secure + unique object key (user_id + timestamp + random token + name)"""
+    safe_name = secure_filename(filename)
+    return f"user_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}_{safe_name}"
+
+
+def storage_error_response(action, e):
+    return jsonify({"error": f"Could not {action}: {e}"}), 400 if e.rejected else 502
 
 # -------------------------
 # 1. Signed URL generator
@@ -38,32 +48,173 @@ def get_upload_url():
 
     if not filename:
         return jsonify({"error": "Missing filename"}), 400
-    
-    content_type = data.get("content_type")
-    print(content_type)
 
-    # Secure + unique filename (user_id + timestamp + ext)
-    ext = os.path.splitext(filename)[1].lower()
-    safe_name = secure_filename(filename)
-    object_key = f"user_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{safe_name}"
-    receipt_path=f"https://pub-{ACCOUNT_ID}.r2.dev/{object_key}"
+    object_key = new_object_key(user_id, filename)
 
     # Presigned URL for direct upload
-    presigned_url = s3_client.generate_presigned_url(
-        ClientMethod="put_object",
-        Params={"Bucket": BUCKET_NAME, "Key": object_key, "ContentType": content_type},
-        ExpiresIn=300,  # 5 minutes
-        HttpMethod="PUT"
-    )
+    try:
+        presigned_url = storage.sign_put(
+            object_key, data.get("content_type"), expires_in=current_app.config["RECEIPT_UPLOAD_URL_TTL"]
+        )
+    except StorageError as e:
+        return storage_error_response("sign upload", e)
 
     return jsonify({
         "uploadUrl": presigned_url,
         "fileKey": object_key,
-        "publicUrl": receipt_path
+        "publicUrl": storage.public_url(object_key)
     }), 200
 
+
+@receipts_bp.route('/get-signed-upload-urls', methods=['POST'])
+@jwt_required()
+def get_upload_urls():
+    """Presigned PUT URLs for many files in one round trip.
+
+    Body: ``{"files": [{"filename": ..., "content_type": ...}, ...]}``.
+    Signing is local (no call to R2), so a batch costs about as much as one.
+    """
+    files = (request.get_json(silent=True) or {}).get("files")
+    if not isinstance(files, list) or not files:
+        return jsonify({"error": "Expected a non-empty list of files"}), 400
+    max_batch = current_app.config["RECEIPT_PRESIGN_BATCH_MAX"]
+    if len(files) > max_batch:
+        return jsonify({"error": f"At most {max_batch} files per request"}), 413
+    if any(not isinstance(f, dict) or not f.get("filename") for f in files):
+        return jsonify({"error": "Every file needs a filename"}), 400
+
+    user_id = get_jwt_identity()
+    ttl = current_app.config["RECEIPT_UPLOAD_URL_TTL"]
+    uploads = []
+    try:
+        for f in files:
+            object_key = new_object_key(user_id, f["filename"])
+            uploads.append({
+                "filename": f["filename"],
+                "uploadUrl": storage.sign_put(object_key, f.get("content_type"), expires_in=ttl),
+                "fileKey": object_key,
+                "publicUrl": storage.public_url(object_key),
+            })
+    except StorageError as e:
+        return storage_error_response("sign uploads", e)
+    return jsonify({"uploads": uploads}), 200
+
+# -------------------------
+# 2. Multipart uploads
+# -------------------------
+@receipts_bp.route('/multipart', methods=['POST'])
+@jwt_required()
+def start_multipart_upload():
+    """Start a multipart upload and presign a URL for every part.
+
+    Body: ``{"filename", "content_type", "size"}`` (size in bytes). The
+    client PUTs each ``partSize`` slice to its URL, in parallel and retrying
+    only failed parts, then calls ``/multipart/complete`` with the ETags.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename")
+    if not filename:
+        return jsonify({"error": "Missing filename"}), 400
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be the file size in bytes"}), 400
+
+    part_size = current_app.config["RECEIPT_MULTIPART_PART_SIZE"]
+    part_count = max(1, math.ceil(size / part_size))
+    if size <= 0 or part_count > MAX_MULTIPART_PARTS:
+        return jsonify({"error": f"size must be between 1 and {part_size * MAX_MULTIPART_PARTS} bytes"}), 400
+
+    object_key = new_object_key(get_jwt_identity(), filename)
+    ttl = current_app.config["RECEIPT_UPLOAD_URL_TTL"]
+    try:
+        upload_id = storage.create_multipart_upload(object_key, data.get("content_type"))
+        parts = [
+            {"partNumber": number, "url": storage.sign_upload_part(object_key, upload_id, number, expires_in=ttl)}
+            for number in range(1, part_count + 1)
+        ]
+    except StorageError as e:
+        return storage_error_response("start upload", e)
+
+    return jsonify({
+        "uploadId": upload_id,
+        "fileKey": object_key,
+        "publicUrl": storage.public_url(object_key),
+        "partSize": part_size,
+        "parts": parts,
+    }), 200
+
+
+@receipts_bp.route('/multipart/complete', methods=['POST'])
+@jwt_required()
+def complete_multipart_upload():
+    """Body: ``{"fileKey", "uploadId", "parts": [{"partNumber", "etag"}, ...]}``"""
+    data = request.get_json(silent=True) or {}
+    object_key, upload_id, parts = data.get("fileKey"), data.get("uploadId"), data.get("parts")
+    if not owns_key(get_jwt_identity(), object_key) or not upload_id:
+        return jsonify({"error": "Unknown upload"}), 404
+    try:
+        completed = sorted(({"PartNumber": int(p["partNumber"]), "ETag": p["etag"]} for p in parts),
+                           key=lambda p: p["PartNumber"])
+    except (TypeError, KeyError, ValueError):
+        return jsonify({"error": "parts must list partNumber and etag for every uploaded part"}), 400
+    if not completed:
+        return jsonify({"error": "parts must list partNumber and etag for every uploaded part"}), 400
+
+    try:
+        storage.complete_multipart_upload(object_key, upload_id, completed)
+    except StorageError as e:
+        return storage_error_response("complete upload", e)
+    return jsonify({"fileKey": object_key, "publicUrl": storage.public_url(object_key)}), 200
+
+
+@receipts_bp.route('/multipart/abort', methods=['POST'])
+@jwt_required()
+def abort_multipart_upload():
+    """Body: ``{"fileKey", "uploadId"}``; discards the parts uploaded so far"""
+    data = request.get_json(silent=True) or {}
+    object_key, upload_id = data.get("fileKey"), data.get("uploadId")
+    if not owns_key(get_jwt_identity(), object_key) or not upload_id:
+        return jsonify({"error": "Unknown upload"}), 404
+    try:
+        storage.abort_multipart_upload(object_key, upload_id)
+    except StorageError as e:
+        return storage_error_response("abort upload", e)
+    return "", 204
+
+# -------------------------
+# 3. List
+# -------------------------
+@receipts_bp.route('/', methods=['GET'])
+@jwt_required()
+@cached_get('receipt_entries', per_user=True)
+def list_receipts():
+    """The caller's receipts; ``from``/``to`` narrow (and order) them by receipt date"""
+    date_from, date_to = requested_date_range()
+    if date_from is None and date_to is None:
+        order_columns = (ReceiptEntry.id,)
+    else:
+        order_columns = (ReceiptEntry.date, ReceiptEntry.id)
+    scope = owned_within_dates('date', date_from, date_to)
+
+    if wants_stream():
+        return stream_collection('receipts', ReceiptEntry, *order_columns, scope=scope)
+
+    receipts, next_cursor = fetch_projected_page(db_session, ReceiptEntry, *order_columns, scope=scope)
+    return jsonify({'receipts': receipts, 'next_cursor': next_cursor}), 200
+
+# -------------------------
+# 4. Export
+# -------------------------
+@receipts_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_receipts():
+    """Stream the caller's receipts (joined with vendor names) as CSV or XLSX"""
+    owner_id, date_from, date_to = export_filters()
+    return export_response(receipts_export(owner_id, date_from, date_to), 'receipts')
+
 # -------------------------
-# 2. Archive access
+# 5. Archive access
 # # -------------------------
 # @receipts_bp.route('/receipts-archive', methods=['GET'])
 # @jwt_required()
@@ -75,42 +226,78 @@ def get_upload_url():
 #     return jsonify({'receipt_data_objects': serialized})
 
 # -------------------------
-# 3. Delete all receipts for user
+# 6. Delete all receipts for user
 # -------------------------
-# @receipts_bp.route("/delete-receipts", methods=["POST"])
-# @jwt_required()
-# def delete_receipts():
-#     try:
-#         user_receipts = db_session.query(ReceiptDataObject).filter_by(
-#             user_id=current_user.id
-#         ).all()
-
-#         if not user_receipts:
-#             return jsonify({"message": "No receipts found for this user"}), 404
-
-#         deleted_files = []
-#         failed_files = []
-
-#         for rdo in user_receipts:
-#             try:
-#                 if rdo.receipt:
-#                     s3_client.delete_object(Bucket=BUCKET_NAME, Key=rdo.receipt.filename)
-#                     deleted_files.append(rdo.receipt.filename)
-#             except Exception as e:
-#                 print(f"Failed to delete {rdo.receipt.filename}: {e}")
-#                 failed_files.append(rdo.receipt.filename)
-
-#             if rdo.receipt:
-#                 db_session.delete(rdo.receipt)
-#             db_session.delete(rdo)
-
-#         db_session.commit()
-
-#         return jsonify({
-#             "message": "User receipts deleted",
-#             "deleted_files": deleted_files,
-#             "failed_files": failed_files
-#         })
-#     except Exception as e:
-#         print("Failed to delete:", e)
-#         return jsonify({'message': 'Error deleting receipts'}), 500
+@receipts_bp.route("/delete-receipts", methods=["POST"])
+@jwt_required()
+def delete_receipts():
+    """Delete the caller's receipts now and their stored images in the background.
+
+    The rows go in one statement each (purchase logs pointing at them are
+    unlinked, not deleted). The images and their previews are deleted by a
+    job committed together with the rows, which sends concurrent 1000-key
+    batches and is retried until the store has them gone. Poll
+    ``status_url`` for the per-key outcome.
+    """
+    user_id = int(get_jwt_identity())
+    receipts = db_session.execute(
+        select(ReceiptEntry.id, ReceiptEntry.filename, ReceiptEntry.thumbnail_url)
+        .where(ReceiptEntry.user_id == user_id)
+    ).all()
+    if not receipts:
+        return jsonify({"message": "No receipts found for this user"}), 404
+
+    object_keys = []
+    for _, filename, thumbnail_url in receipts:
+        # filename comes from the client; only ever delete this user's own objects
+        if owns_key(user_id, filename):
+            object_keys.append(filename)
+            if thumbnail_url:
+                object_keys.extend(thumbnail_keys(filename).values())
+
+    # receipts added since the select above are left alone
+    doomed = [ReceiptEntry.user_id == user_id, ReceiptEntry.id <= max(receipt.id for receipt in receipts)]
+    db_session.execute(
+        update(RawMaterialPurchaseLog)
+        .where(
+            RawMaterialPurchaseLog.user_id == user_id,
+            RawMaterialPurchaseLog.receipt_entry_id.in_(select(ReceiptEntry.id).where(*doomed)),
+        )
+        .values(receipt_entry_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_receipts = db_session.execute(
+        delete(ReceiptEntry).where(*doomed).execution_options(synchronize_session=False)
+    ).rowcount
+    job_id = queue_deletes(db_session, object_keys, user_id=user_id)
+    record_write(db_session, RawMaterialPurchaseLog.__tablename__, [user_id])
+    record_write(db_session, ReceiptEntry.__tablename__, [user_id])
+    db_session.commit()
+
+    return jsonify({
+        "message": "User receipts deleted",
+        "deleted_receipts": deleted_receipts,
+        "queued_files": len(object_keys),
+        "job_id": job_id,
+        "status_url": url_for('receipts.delete_receipts_status', job_id=job_id) if job_id else None,
+    }), 202
+
+
+@receipts_bp.route("/delete-receipts/<int:job_id>", methods=["GET"])
+@jwt_required()
+def delete_receipts_status(job_id):
+    """Progress of a delete-receipts job: which files are gone and which failed (and why)"""
+    job = job_status(db_session, job_id)
+    if job is None or job["kind"] != "delete_objects" or job["payload"].get("user_id") != int(get_jwt_identity()):
+        return jsonify({"error": "Unknown job"}), 404
+
+    result = job["result"] or {}
+    return jsonify({
+        "job_id": job_id,
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "queued_files": len(job["payload"]["keys"]),
+        "deleted_files": result.get("deleted", []),
+        "failed_files": [{"fileKey": key, "error": error} for key, error in result.get("failed", {}).items()],
+        "last_error": job["last_error"],
+    }), 200
@@ -0,0 +1,58 @@
+from flask import jsonify, Blueprint, request
+from flask_jwt_extended import jwt_required
+from ..db import db_session
+from ..db.pagination import decode_offset, encode_offset, page_params
+from ..db.scoping import current_user_id
+from ..services.name_index import INDEXES, suggest
+from ..services.search import ENTITIES, search
+from ..web.caching import cached_get
+
+search_bp = Blueprint('search', __name__)
+
+SEARCHED_TABLES = tuple(spec['table'] for spec in ENTITIES.values())
+
+@search_bp.route("/", methods=["GET"], strict_slashes=False)
+@jwt_required()
+@cached_get(*SEARCHED_TABLES, per_user=True)
+def search_all():
+    """Ranked, prefix-aware full-text search across materials, vendors, purchase notes, receipts and tasks."""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"msg": "Missing q"}), 400
+
+    types = [t for t in request.args.get('types', '').split(',') if t]
+    unknown = [t for t in types if t not in ENTITIES]
+    if unknown:
+        return jsonify({"msg": f"Unknown type(s): {', '.join(unknown)}"}), 400
+
+    limit, cursor = page_params()
+    offset = decode_offset(cursor)
+
+    hits, has_more = search(db_session, q, current_user_id(), types or None, limit, offset)
+
+    return jsonify({
+        'results': hits,
+        'next_cursor': encode_offset(offset + limit) if has_more else None
+    }), 200
+
+
+@search_bp.route("/suggest", methods=["GET"])
+@jwt_required()
+def suggest_names():
+    """Closest existing vendor or raw-material names, for "did you mean" prompts while typing."""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"msg": "Missing q"}), 400
+
+    kind = request.args.get('type', 'raw_material')
+    if kind not in INDEXES:
+        return jsonify({"msg": f"type must be one of {', '.join(INDEXES)}"}), 400
+
+    try:
+        limit = int(request.args.get('limit', 5))
+    except ValueError:
+        return jsonify({"msg": "limit must be an integer"}), 400
+    if not 1 <= limit <= 50:
+        return jsonify({"msg": "limit must be between 1 and 50"}), 400
+
+    return jsonify({'suggestions': suggest(kind, q, limit=limit)}), 200
@@ -1,31 +1,38 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
-from ..db import SessionLocal
-from ..models import Task
+from flask_jwt_extended import jwt_required
+from datetime import datetime
+from ..db import db_session
+from ..db.projection import fetch_projected_page
+from ..db.scoping import current_user_id, owned_by_current_user
+from ..dates import parse_datetime
+from ..models import Task, TaskTimeBucket
+from ..services.exports import tasks_export
+from ..services.time_rollups import GRANULARITIES
+from ..web.caching import cached_get
+from ..web.exports import export_filters, export_response
+from ..web.streaming import stream_collection, wants_stream
 
 
 tasks_bp = Blueprint('tasks', __name__)
 
 @tasks_bp.route("/", methods=["GET"])
 @jwt_required()
+@cached_get('tasks', per_user=True)
 def list_tasks():
-    db_session = SessionLocal()
+    if wants_stream():
+        return stream_collection('tasks', Task, Task.start_datetime, Task.id, scope=owned_by_current_user)
 
-    tasks = db_session.query(Task).all()
-
-    tasks_serialized = [t.to_dict() for t in tasks]
-
-    db_session.close()
+    tasks_serialized, next_cursor = fetch_projected_page(
+        db_session, Task, Task.start_datetime, Task.id, scope=owned_by_current_user
+    )
 
-    return jsonify({'tasks': tasks_serialized}), 200
+    return jsonify({'tasks': tasks_serialized, 'next_cursor': next_cursor}), 200
 
 
 @tasks_bp.route("/", methods=["POST"])
 @jwt_required()
 def register_task():
-    db_session = SessionLocal()
-
-    user_id = get_jwt_identity()
+    user_id = current_user_id()
 
     data = request.get_json()
 
@@ -35,8 +42,11 @@ def register_task():
     end_datetime = data['end']
     memo = data['memo']
 
-    parsed_start_datetime = datetime.strptime(start_datetime, "%Y-%m-%dT%H:%M:%S.%fZ") #type: ignore
-    parsed_end_datetime =  datetime.strptime(end_datetime, "%Y-%m-%dT%H:%M:%S.%fZ") #type: ignore
+    try:
+        parsed_start_datetime = parse_datetime(start_datetime)
+        parsed_end_datetime = parse_datetime(end_datetime)
+    except ValueError:
+        return jsonify({"msg": "start and end must be ISO-8601 datetimes"}), 400
     total_time = (parsed_end_datetime - parsed_start_datetime).total_seconds()
 
 
@@ -51,52 +61,93 @@ def register_task():
     )
     db_session.add(new_task)
     db_session.commit()
-    db_session.close()
     return jsonify({"msg": "Task created"}), 201
 
 
+@tasks_bp.route("/export", methods=["GET"])
+@jwt_required()
+def export_tasks():
+    owner_id, date_from, date_to = export_filters()
+    return export_response(tasks_export(owner_id, date_from, date_to), 'tasks')
+
+
+@tasks_bp.route("/time-summary", methods=["GET"])
+@jwt_required()
+@cached_get('tasks', 'task_time_buckets', per_user=True)
+def get_task_time_summary():
+    """Tracked seconds per day/week/month bucket, read from the pre-aggregated buckets."""
+    granularity = request.args.get('granularity', 'week')
+    if granularity not in GRANULARITIES:
+        return jsonify({"msg": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    _, date_from, date_to = export_filters()
+
+    query = db_session.query(TaskTimeBucket).filter_by(user_id=current_user_id(), granularity=granularity)
+    if date_from is not None:
+        query = query.filter(TaskTimeBucket.bucket_start >= date_from)
+    if date_to is not None:
+        query = query.filter(TaskTimeBucket.bucket_start < date_to)
+    buckets = [b.to_dict() for b in query.order_by(TaskTimeBucket.bucket_start)]
+
+    return jsonify({
+        'granularity': granularity,
+        'buckets': buckets,
+        'total_seconds': sum(b['total_seconds'] for b in buckets)
+    }), 200
+
+
 @tasks_bp.route("/<int:task_id>", methods=["GET"])
 @jwt_required()
+@cached_get('tasks', per_user=True)
 def get_task(task_id):
-    db_session = SessionLocal()
-
-    task = db_session.query(Task).filter_by(id=task_id).first()
+    task = owned_by_current_user(db_session.query(Task), Task).filter_by(id=task_id).first()
 
     if task:
-        return jsonify({'task': task})
+        return jsonify({'task': task.to_dict()})
     else:
         return "", 404
 
 @tasks_bp.route("/<int:task_id>", methods=["PUT"])
 @jwt_required()
 def update_task(task_id):
-    db_session = SessionLocal()
-    
     data = request.get_json()
 
     name = data['name']
     description = data['description']
     memo = data['memo']
 
-    task = db_session.query(Task).filter_by(id=task_id).first()
+    task = db_session.query(Task).filter_by(id=task_id, user_id=current_user_id()).first()
+
+    if not task:
+        return "", 404
 
     task.name = name       #type: ignore
     task.description = description       #type: ignore
     task.memo = memo       #type: ignore
 
-    db_session.close()
+    if data.get('start') or data.get('end'):
+        try:
+            start_datetime = parse_datetime(data['start']) if data.get('start') else task.start_datetime
+            end_datetime = parse_datetime(data['end']) if data.get('end') else task.end_datetime
+        except ValueError:
+            return jsonify({"msg": "start and end must be ISO-8601 datetimes"}), 400
+        task.start_datetime = start_datetime       #type: ignore
+        task.end_datetime = end_datetime       #type: ignore
+        task.total_time = (end_datetime - start_datetime).total_seconds()       #type: ignore
+
+    db_session.commit()
 
     return jsonify({'success': True}), 200
 
 @tasks_bp.route("/<int:task_id>", methods=["DELETE"])
 @jwt_required()
 def delete_task(task_id):
-    db_session = SessionLocal()
+    task = db_session.query(Task).filter_by(id=task_id, user_id=current_user_id()).first()
 
-    task = db_session.query(Task).filter_by(id=task_id).first()
+    if not task:
+        return "", 404
 
     db_session.delete(task)
     db_session.commit()
-    db_session.close()
 
     return "", 204
\ No newline at end of file
@@ -1,13 +1,17 @@
 from flask import request, jsonify, Blueprint
-from flask_jwt_extended import jwt_required
-from werkzeug.security import generate_password_hash
+from flask_jwt_extended import get_jwt, jwt_required
 from ..models import User
-from ..db import SessionLocal
+from ..db import db_session
+from ..db.scoping import current_user_id
+from ..db.projection import fetch_projected_page
+from ..services.identities import invalidate_user, user_by_id
+from ..services.passwords import password_hasher
+from ..web.caching import cached_get
+from ..web.streaming import stream_collection, wants_stream
 
 users_bp = Blueprint('users', __name__)
 
 def create_user(username, password_hash, email, phone, is_admin):
-    db_session = SessionLocal()
     already_there = db_session.query(User).filter(User.username==username).first()
 
     if not already_there:
@@ -22,38 +26,28 @@ def create_user(username, password_hash, email, phone, is_admin):
 
         db_session.add(user)
         db_session.commit()
+        invalidate_user(user.id)
     else:
         raise ValueError("User already exists")
-    db_session.close()
 
 def get_user_by_user_id(user_id):
-    db_session = SessionLocal()
-    user = db_session.query(User).filter_by(id=user_id).first()
-    db_session.close()
-    if user:
-        # return consistent keys
-        return {
-            "id": user.id,
-            "username": user.username,
-            "password_hash": user.password_hash,
-            "is_admin": user.is_admin
-        }
-    return None
-    
+    return user_by_id(db_session, user_id)
+
+def may_manage(user_id):
+    """Accounts can only be changed by their owner or by an admin."""
+    return user_id == current_user_id() or bool(get_jwt().get("is_admin"))
 
 
 @users_bp.route("/", methods=["GET"])
 @jwt_required()
+@cached_get('users')
 def list_users():
-    db_session = SessionLocal()
-
-    users = db_session.query(User).all()
+    if wants_stream():
+        return stream_collection('users', User, User.id)
 
-    users_serialized = [u.to_dict() for u in users]
+    users_serialized, next_cursor = fetch_projected_page(db_session, User, User.id)
 
-    db_session.close()
-
-    return jsonify({'users': users_serialized}), 200
+    return jsonify({'users': users_serialized, 'next_cursor': next_cursor}), 200
 
 
 @users_bp.route("/register", methods=["POST"])
@@ -70,7 +64,10 @@ def register_user():
     else:
         is_admin = False
 
-    password_hash = generate_password_hash(data.get('password'))        #type: ignore
+    if not username or not data.get('password'):
+        return jsonify({"msg": "Missing username or password"}), 400
+
+    password_hash = password_hasher.hash(data.get('password'))
 
     try:
         create_user(username, password_hash, email, phone, is_admin)
@@ -80,21 +77,21 @@ def register_user():
 
 @users_bp.route("/<int:user_id>", methods=["GET"])
 @jwt_required()
+@cached_get('users')
 def get_user(user_id):
-    db_session = SessionLocal()
-
     user = db_session.query(User).filter_by(id=user_id).first()
 
     if user:
-        return jsonify({'user': user})
+        return jsonify({'user': user.to_dict()})
     else:
         return "", 404
 
 @users_bp.route("/<int:user_id>", methods=["PUT"])
 @jwt_required()
 def update_user(user_id):
-    db_session = SessionLocal()
-    
+    if not may_manage(user_id):
+        return jsonify({"msg": "Not allowed to change this user"}), 403
+
     data = request.form
 
     username = data.get('username')
@@ -102,26 +99,43 @@ def update_user(user_id):
     phone = data.get('phone')
     isAdmin = data.get('is_admin')
 
+    if not username:
+        return jsonify({"msg": "Missing username"}), 400
+
     user = db_session.query(User).filter_by(id=user_id).first()
 
+    if not user:
+        return "", 404
+
+    taken = db_session.query(User).filter(User.username == username, User.id != user_id).first()
+    if taken:
+        return jsonify({"msg": "User already exists"}), 400
+
     user.username = username       #type: ignore
     user.email = email       #type: ignore
     user.phone = phone       #type: ignore
-    user.is_admin = isAdmin       #type: ignore
+    # only admins grant or revoke admin rights; everyone else's value is ignored
+    if isAdmin is not None and get_jwt().get("is_admin"):
+        user.is_admin = isAdmin in ('1', 'true', 'True')       #type: ignore
 
-    db_session.close()
+    db_session.commit()
+    invalidate_user(user_id)
 
     return jsonify({'success': True}), 200
 
 @users_bp.route("/<int:user_id>", methods=["DELETE"])
 @jwt_required()
 def delete_user(user_id):
-    db_session = SessionLocal()
+    if not may_manage(user_id):
+        return jsonify({"msg": "Not allowed to delete this user"}), 403
 
     user = db_session.query(User).filter_by(id=user_id).first()
 
+    if not user:
+        return "", 404
+
     db_session.delete(user)
     db_session.commit()
-    db_session.close()
+    invalidate_user(user_id)
 
     return "", 204
\ No newline at end of file
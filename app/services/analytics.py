@@ -0,0 +1,183 @@
+"""Vectorized spend analytics over raw material purchase logs.
+
+One query loads the purchases as columns, with NULLs already replaced by
+defaults in SQL; every aggregate after that is a NumPy groupby
+(``np.unique(..., return_inverse=True)`` + ``np.bincount``).
+"""
+from sqlalchemy import String, func, literal, select
+
+from ..models import RawMaterial, RawMaterialPurchaseLog
+
+np = None  # bound by _require_numpy(): numpy is optional and slow to import
+
+BUCKETS = ("day", "week", "month", "year")
+
+# joins composite group keys; cannot appear in names typed by users
+SEP = "\x1f"
+
+
+class AnalyticsUnavailable(RuntimeError):
+    pass
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - numpy is optional
+            raise AnalyticsUnavailable("Analytics need numpy installed")
+        np = numpy
+    return np
+
+
+def load_purchase_columns(session, owner_id=None, date_from=None, date_to=None):
+    """Purchases as a dict of equal-length NumPy arrays."""
+    _require_numpy()
+
+    logs = RawMaterialPurchaseLog
+    day = func.substr(logs.purchase_date, 1, 10, type_=String)
+    stmt = (
+        select(
+            func.coalesce(logs.cost, literal(0.0)),
+            func.coalesce(logs.purchase_amount, literal(0.0)),
+            day,
+            logs.item_id,
+            logs.vendor_id,
+            func.coalesce(logs.purchase_unit, literal("")),
+            func.coalesce(RawMaterial.category, literal("uncategorized")),
+            func.coalesce(RawMaterial.subcategory, literal("")),
+        )
+        .join(RawMaterial, RawMaterial.id == logs.item_id)
+        .where(logs.purchase_date.isnot(None))
+    )
+    if owner_id is not None:
+        stmt = stmt.where(logs.user_id == owner_id)
+    if date_from is not None:
+        stmt = stmt.where(logs.purchase_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(logs.purchase_date < date_to)
+
+    rows = session.execute(stmt).all()
+    columns = list(zip(*rows)) if rows else [()] * 8
+    cost, amount, days, item_id, vendor_id, unit, category, subcategory = columns
+
+    return {
+        "cost": np.array(cost, dtype=np.float64),
+        "purchase_amount": np.array(amount, dtype=np.float64),
+        "purchase_date": np.array(days, dtype="datetime64[D]"),
+        "item_id": np.array(item_id, dtype=np.int64),
+        "vendor_id": np.array(vendor_id, dtype=np.int64),
+        "purchase_unit": np.array(unit, dtype=object),
+        "category": np.array(category, dtype=object),
+        "subcategory": np.array(subcategory, dtype=object),
+    }
+
+
+def bucket_dates(dates, bucket):
+    """Bucket start (as ``datetime64[D]``) for every date."""
+    if bucket == "day":
+        return dates
+    if bucket == "week":
+        # weeks start on Monday; 1970-01-01 was a Thursday
+        days = dates.astype(np.int64)
+        return (days - (days + 3) % 7).astype("datetime64[D]")
+    if bucket == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    if bucket == "year":
+        return dates.astype("datetime64[Y]").astype("datetime64[D]")
+    raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+
+
+def bucket_range(periods, bucket):
+    """Every bucket start from the first to the last of the sorted ``periods``, empty ones included."""
+    if not len(periods):
+        return periods
+    unit, step = {"day": ("D", 1), "week": ("D", 7), "month": ("M", 1), "year": ("Y", 1)}[bucket]
+    starts = periods.astype(f"datetime64[{unit}]")
+    return np.arange(starts[0], starts[-1] + 1, step).astype("datetime64[D]")
+
+
+def _nan_to_none(values):
+    return [None if v != v else v for v in values.tolist()]
+
+
+def moving_average(values, window):
+    """Trailing mean; the first ``window - 1`` points have no full window (NaN)."""
+    out = np.full(values.shape, np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.insert(values, 0, 0.0))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+def _group_totals(keys, cost, amount):
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return (
+        uniq,
+        inverse,
+        np.bincount(inverse, weights=cost, minlength=len(uniq)),
+        np.bincount(inverse, weights=amount, minlength=len(uniq)),
+        np.bincount(inverse, minlength=len(uniq)),
+    )
+
+
+def spend_analytics(columns, bucket="month", window=3):
+    cost, amount = columns["cost"], columns["purchase_amount"]
+    buckets = bucket_dates(columns["purchase_date"], bucket)
+
+    # spend per time bucket, zero-filled so the moving average spans calendar periods
+    purchased, _, purchased_spend, purchased_quantity, purchased_counts = _group_totals(buckets, cost, amount)
+    periods = bucket_range(purchased, bucket)
+    positions = np.searchsorted(periods, purchased)
+    spend, quantity, counts = np.zeros(len(periods)), np.zeros(len(periods)), np.zeros(len(periods), dtype=np.int64)
+    spend[positions], quantity[positions], counts[positions] = purchased_spend, purchased_quantity, purchased_counts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_unit_cost = np.where(quantity > 0, spend / quantity, np.nan)
+    time_series = {
+        "period_start": [str(p) for p in periods],
+        "spend": spend.tolist(),
+        "quantity": quantity.tolist(),
+        "purchase_count": counts.tolist(),
+        "average_unit_cost": _nan_to_none(avg_unit_cost),
+        "moving_average_spend": _nan_to_none(moving_average(spend, window)),
+    }
+
+    # unit cost per material/unit and bucket
+    pair_keys = np.char.add(
+        np.char.add(columns["item_id"].astype(str), SEP), columns["purchase_unit"].astype(str)
+    )
+    series_keys = np.char.add(np.char.add(pair_keys, SEP), buckets.astype(str))
+    uniq, _, series_cost, series_qty, _ = _group_totals(series_keys, cost, amount)
+    unit_cost_trends = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_costs = np.where(series_qty > 0, series_cost / series_qty, np.nan)
+    for key, value in zip(uniq.tolist(), _nan_to_none(unit_costs)):
+        item_id, unit, period = key.split(SEP)
+        trend = unit_cost_trends.setdefault((item_id, unit), {
+            "item_id": int(item_id), "purchase_unit": unit, "period_start": [], "unit_cost": [],
+        })
+        trend["period_start"].append(period)
+        trend["unit_cost"].append(value)
+
+    # category / subcategory breakdown
+    category_keys = np.char.add(
+        np.char.add(columns["category"].astype(str), SEP), columns["subcategory"].astype(str)
+    )
+    cats, _, cat_spend, cat_qty, cat_counts = _group_totals(category_keys, cost, amount)
+    by_category = []
+    for key, s, n in zip(cats.tolist(), cat_spend.tolist(), cat_counts.tolist()):
+        category, subcategory = key.split(SEP, 1)
+        by_category.append({
+            "category": category, "subcategory": subcategory or None, "spend": s, "purchase_count": n,
+        })
+
+    return {
+        "bucket": bucket,
+        "window": window,
+        "total_spend": float(cost.sum()),
+        "purchase_count": int(len(cost)),
+        "time_series": time_series,
+        "unit_cost_trends": list(unit_cost_trends.values()),
+        "by_category": by_category,
+    }
@@ -0,0 +1,246 @@
+"""Response cache: an in-process LRU+TTL layer with an optional shared tier.
+
+Entries are tagged (``"<table>:<user_id>"``) so writes can drop exactly the
+responses built from the rows they changed; see ``invalidate_tags``.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """Thread-safe mapping with a size bound (LRU) and per-entry expiry."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tags=(), ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteCacheBackend:
+    """Cache tier in a SQLite file, shared by every worker on the host.
+
+    Tags live in their own ``(tag, key)`` table, so invalidating a tag is an
+    index lookup rather than a scan of every entry; deleting an entry
+    cascades to its tag rows. Expired entries are pruned at most once per
+    ``ttl`` by whichever worker writes next.
+    """
+
+    # bumped whenever the tables change; being a cache, an old file is just emptied
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._pruned_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS response_cache_tags")
+                conn.execute("DROP TABLE IF EXISTS response_cache")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires_at ON response_cache (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache_tags ("
+                " tag TEXT NOT NULL,"
+                " key TEXT NOT NULL REFERENCES response_cache (key) ON DELETE CASCADE,"
+                " PRIMARY KEY (tag, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_tags_key ON response_cache_tags (key)")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, tags=(), ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            # a plain DELETE (not INSERT OR REPLACE) so the old tag rows cascade away
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT INTO response_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, expires_at, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO response_cache_tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags]
+            )
+        if time.monotonic() - self._pruned_at >= self.ttl:
+            self.prune()
+
+    def invalidate_tags(self, tags):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache_tags WHERE tag = ?)",
+                [(tag,) for tag in tags],
+            )
+
+    def prune(self):
+        self._pruned_at = time.monotonic()
+        self._connect().execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM response_cache")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache:
+    """Local LRU in front of an optional shared backend."""
+
+    def __init__(self):
+        self.local = LRUTTLCache()
+        self.shared = None
+        self.enabled = True
+
+    def configure(self, config):
+        self.enabled = config.get("RESPONSE_CACHE_ENABLED", True)
+        ttl = config.get("RESPONSE_CACHE_TTL", 60)
+        self.local = LRUTTLCache(maxsize=config.get("RESPONSE_CACHE_MAXSIZE", 1024), ttl=ttl)
+        self.shared = None
+        if config.get("RESPONSE_CACHE_BACKEND") == "sqlite":
+            path = config.get("RESPONSE_CACHE_PATH") or "response_cache.db"
+            self.shared = SQLiteCacheBackend(os.path.abspath(path), ttl=ttl)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value, tags=()):
+        if not self.enabled:
+            return
+        self.local.set(key, value, tags)
+        if self.shared is not None:
+            self.shared.set(key, value, tags)
+
+    def invalidate_tags(self, tags):
+        tags = list(tags)
+        self.local.invalidate_tags(tags)
+        if self.shared is not None:
+            self.shared.invalidate_tags(tags)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        stats = {"enabled": self.enabled, "local": self.local.stats()}
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,153 @@
+"""Flat CSV/XLSX exports built from one joined query each.
+
+Rows are pulled with ``yield_per`` and written out batch by batch, so memory
+stays flat however long the export is.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import select
+
+from ..models import RawMaterial, RawMaterialPurchaseLog, ReceiptEntry, Task, Vendor
+from ..web.streaming import iter_partitions
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class ExportFormatUnavailable(RuntimeError):
+    pass
+
+
+def _workbook_class():
+    # imported on first XLSX export: openpyxl is optional and slow to import
+    try:
+        from openpyxl import Workbook
+    except ImportError:  # pragma: no cover - openpyxl is optional
+        raise ExportFormatUnavailable("XLSX export needs openpyxl installed")
+    return Workbook
+
+
+def _filtered(stmt, owner_column, owner_id, date_column, date_from, date_to):
+    if owner_id is not None:
+        stmt = stmt.where(owner_column == owner_id)
+    if date_from is not None:
+        stmt = stmt.where(date_column >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(date_column < date_to)
+    return stmt
+
+
+def purchase_logs_export(owner_id=None, date_from=None, date_to=None):
+    columns = [
+        RawMaterialPurchaseLog.id.label("purchase_log_id"),
+        RawMaterialPurchaseLog.purchase_date,
+        RawMaterialPurchaseLog.log_date,
+        RawMaterial.name.label("raw_material"),
+        RawMaterial.category,
+        RawMaterial.subcategory,
+        RawMaterialPurchaseLog.brand,
+        Vendor.name.label("vendor"),
+        RawMaterialPurchaseLog.purchase_amount,
+        RawMaterialPurchaseLog.purchase_unit,
+        RawMaterialPurchaseLog.cost,
+        RawMaterialPurchaseLog.notes,
+        ReceiptEntry.id.label("receipt_id"),
+        ReceiptEntry.filename.label("receipt_filename"),
+        ReceiptEntry.image_url.label("receipt_image_url"),
+        ReceiptEntry.memo.label("receipt_memo"),
+        RawMaterialPurchaseLog.user_id,
+    ]
+    stmt = (
+        select(*columns)
+        .join(RawMaterial, RawMaterial.id == RawMaterialPurchaseLog.item_id)
+        .join(Vendor, Vendor.id == RawMaterialPurchaseLog.vendor_id)
+        .outerjoin(ReceiptEntry, ReceiptEntry.id == RawMaterialPurchaseLog.receipt_entry_id)
+    )
+    stmt = _filtered(
+        stmt, RawMaterialPurchaseLog.user_id, owner_id,
+        RawMaterialPurchaseLog.purchase_date, date_from, date_to,
+    )
+    return stmt.order_by(RawMaterialPurchaseLog.id)
+
+
+def receipts_export(owner_id=None, date_from=None, date_to=None):
+    columns = [
+        ReceiptEntry.id.label("receipt_id"),
+        ReceiptEntry.date,
+        Vendor.name.label("vendor"),
+        ReceiptEntry.filename,
+        ReceiptEntry.image_url,
+        ReceiptEntry.memo,
+        ReceiptEntry.created_at,
+        ReceiptEntry.user_id,
+    ]
+    stmt = select(*columns).outerjoin(Vendor, Vendor.id == ReceiptEntry.vendor_id)
+    stmt = _filtered(stmt, ReceiptEntry.user_id, owner_id, ReceiptEntry.date, date_from, date_to)
+    return stmt.order_by(ReceiptEntry.id)
+
+
+def tasks_export(owner_id=None, date_from=None, date_to=None):
+    columns = [
+        Task.id.label("task_id"),
+        Task.name,
+        Task.description,
+        Task.start_datetime,
+        Task.end_datetime,
+        Task.total_time,
+        Task.memo,
+        Task.user_id,
+    ]
+    stmt = _filtered(select(*columns), Task.user_id, owner_id, Task.start_datetime, date_from, date_to)
+    return stmt.order_by(Task.id)
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(stmt):
+    """CSV text for ``stmt``: a header row, then one chunk per fetched batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([c.name for c in stmt.selected_columns])
+    for partition in iter_partitions(stmt):
+        writer.writerows([_cell(v) for v in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_xlsx(stmt, sheet_title="export"):
+    """XLSX bytes for ``stmt``.
+
+    openpyxl's write-only mode spools rows to disk, so the workbook is built
+    in a temporary file and then streamed out of it.
+    """
+    workbook = _workbook_class()(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append([c.name for c in stmt.selected_columns])
+
+    def generate():
+        for partition in iter_partitions(stmt):
+            for row in partition:
+                sheet.append(list(row))
+
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            workbook.save(path)
+            with open(path, "rb") as f:
+                while chunk := f.read(FILE_CHUNK_SIZE):
+                    yield chunk
+        finally:
+            os.unlink(path)
+
+    return generate()
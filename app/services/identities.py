@@ -0,0 +1,54 @@
+"""Cached user rows for authentication.
+
+Login looks users up by username, and every authenticated request
+resolves its token's user (``current_user``). Both go through one
+LRU+TTL cache that holds each user under two keys, ``("id", id)`` and
+``("username", name)``. Both keys carry the tag ``user:<id>``, so one
+``invalidate_user`` call drops both. Routes that write users invalidate
+explicitly. Other workers see the change once the TTL runs out.
+"""
+from ..models import User
+from .cache import LRUTTLCache
+
+identity_cache = LRUTTLCache(maxsize=4096, ttl=60)
+
+
+def _identity(user):
+    # return consistent keys
+    return {
+        "id": user.id,
+        "username": user.username,
+        "password_hash": user.password_hash,
+        "is_admin": user.is_admin,
+    }
+
+
+def _lookup(session, key, **filters):
+    identity = identity_cache.get(key)
+    if identity is not None:
+        return identity
+    user = session.query(User).filter_by(**filters).first()
+    if user is None:
+        return None
+    identity = _identity(user)
+    tags = (f"user:{user.id}",)
+    identity_cache.set(("id", user.id), identity, tags=tags)
+    identity_cache.set(("username", user.username), identity, tags=tags)
+    return identity
+
+
+def user_by_id(session, user_id):
+    return _lookup(session, ("id", int(user_id)), id=int(user_id))
+
+
+def user_by_username(session, username):
+    return _lookup(session, ("username", username), username=username)
+
+
+def invalidate_user(user_id):
+    identity_cache.invalidate_tags([f"user:{user_id}"])
+
+
+def init_app(app):
+    identity_cache.maxsize = app.config["IDENTITY_CACHE_MAXSIZE"]
+    identity_cache.ttl = app.config["IDENTITY_CACHE_TTL"]
@@ -0,0 +1,378 @@
+"""Durable background jobs, queued in SQLite.
+
+Work that does not have to finish before the response (thumbnails, object
+store deletes, rollup rebuilds) is queued with ``enqueue`` on the
+request's own session. A job therefore exists exactly when the writes that
+asked for it were committed.
+
+Workers claim a job by leasing it: a single ``UPDATE ... RETURNING`` marks
+the oldest due job ``running`` until ``JOB_LEASE_SECONDS`` from now. A
+worker that dies mid-job simply lets the lease run out, and the job is
+claimed again. Failures are retried with exponential backoff until the
+job's ``max_attempts`` are used up, then left ``failed`` for inspection.
+Delivery is at-least-once, so handlers must be idempotent.
+
+``JOB_WORKER_MODE`` picks where handlers run: ``thread`` (worker threads
+in each app process), ``process`` (``flask jobs work`` child processes) or
+``off`` (run ``flask jobs work`` yourself). App processes start their
+workers on the first request they serve, so CLI commands and scripts that
+only build the app never run jobs.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, event, func, insert, or_, select, update
+
+from ..db import SessionLocal
+from ..models import Job
+
+DEFAULT_MAX_ATTEMPTS = 5
+# rolling window of timings behind the latency percentiles
+SAMPLE_SIZE = 1000
+PRUNE_INTERVAL_SECONDS = 600
+
+jobs = Job.__table__
+HANDLERS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobError(RuntimeError):
+    """A failed attempt that still has a ``result`` worth keeping (e.g. partial progress)."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def handler(kind, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register ``fn(payload)`` as the handler for jobs of ``kind``.
+
+    Raise to retry. A JSON-serializable return value (or ``JobError.result``)
+    is stored as the job's ``result``.
+    """
+    def register(fn):
+        HANDLERS[kind] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def _job_row(kind, payload, delay, now):
+    return {
+        "kind": kind,
+        "payload": json.dumps(payload),
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": HANDLERS[kind][1] if kind in HANDLERS else DEFAULT_MAX_ATTEMPTS,
+        "run_at": now + timedelta(seconds=delay),
+        "created_at": now,
+    }
+
+
+def enqueue_many(session, kind, payloads, delay=0):
+    """Queue one ``kind`` job per payload as part of ``session``'s transaction."""
+    now = utcnow()
+    rows = [_job_row(kind, payload, delay, now) for payload in payloads]
+    if not rows:
+        return
+    # through the connection so this also works from flush hooks
+    session.connection().execute(insert(jobs), rows)
+    session.info["jobs_enqueued"] = True
+
+
+def enqueue(session, kind, payload=None, delay=0):
+    """Queue one job as part of ``session``'s transaction and return its id."""
+    job_id = session.connection().execute(
+        insert(jobs).values(**_job_row(kind, payload or {}, delay, utcnow())).returning(jobs.c.id)
+    ).scalar_one()
+    session.info["jobs_enqueued"] = True
+    return job_id
+
+
+def job_status(session, job_id):
+    """The job's progress as a dict (payload and result decoded), or None."""
+    job = session.execute(select(jobs).where(jobs.c.id == job_id)).first()
+    if job is None:
+        return None
+    status = job._asdict()
+    for field in ("payload", "result"):
+        status[field] = json.loads(status[field]) if status[field] else None
+    return status
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None}
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+    }
+
+
+class JobQueue:
+    def __init__(self):
+        self.mode = "thread"
+        self.workers = 2
+        self.poll_seconds = 1.0
+        self.lease_seconds = 300
+        self.backoff_seconds = 5
+        self.backoff_max_seconds = 3600
+        self.retention_seconds = 86400
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._processes = []
+        self.started = False
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self._counts = Counter()
+        self._waits = deque(maxlen=SAMPLE_SIZE)
+        self._runs = deque(maxlen=SAMPLE_SIZE)
+
+    def configure(self, config):
+        self.mode = config["JOB_WORKER_MODE"]
+        self.workers = config["JOB_WORKERS"]
+        self.poll_seconds = config["JOB_POLL_SECONDS"]
+        self.lease_seconds = config["JOB_LEASE_SECONDS"]
+        self.backoff_seconds = config["JOB_BACKOFF_SECONDS"]
+        self.backoff_max_seconds = config["JOB_BACKOFF_MAX_SECONDS"]
+        self.retention_seconds = config["JOB_RETENTION_SECONDS"]
+
+    # -- claiming and settling ---------------------------------------------
+
+    def claim(self, worker_id):
+        """Lease the oldest due job to ``worker_id``; None when nothing is due."""
+        now = utcnow()
+        due = (
+            select(jobs.c.id)
+            .where(or_(
+                and_(jobs.c.status == "queued", jobs.c.run_at <= now),
+                and_(jobs.c.status == "running", jobs.c.locked_until < now),
+            ))
+            .order_by(jobs.c.run_at, jobs.c.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        with SessionLocal() as session:
+            job = session.execute(
+                update(jobs)
+                .where(jobs.c.id == due)
+                .values(
+                    status="running",
+                    attempts=jobs.c.attempts + 1,
+                    locked_by=worker_id,
+                    locked_until=now + timedelta(seconds=self.lease_seconds),
+                    started_at=now,
+                )
+                .returning(jobs.c.id, jobs.c.kind, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts, jobs.c.run_at)
+            ).first()
+            session.commit()
+        return job
+
+    def _settle(self, job, worker_id, **values):
+        # a worker whose lease ran out no longer owns the job
+        with SessionLocal() as session:
+            session.execute(
+                update(jobs).where(jobs.c.id == job.id, jobs.c.locked_by == worker_id).values(**values)
+            )
+            session.commit()
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_one(self, worker_id):
+        """Claim and run one job; False when none was due."""
+        job = self.claim(worker_id)
+        if job is None:
+            return False
+        started = time.monotonic()
+        self._waits.append(max(0.0, (utcnow() - job.run_at).total_seconds()))
+        registered = HANDLERS.get(job.kind)
+        try:
+            if registered is None:
+                raise LookupError(f"No handler for job kind {job.kind!r}")
+            result = registered[0](json.loads(job.payload or "{}"))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            result = json.dumps(e.result) if isinstance(e, JobError) and e.result is not None else None
+            if registered is None or job.attempts >= job.max_attempts:
+                self._counts["failed"] += 1
+                logger.error("Job %s (%s) failed for good: %s", job.id, job.kind, error)
+                self._settle(job, worker_id, status="failed", last_error=error, result=result, locked_until=None,
+                             finished_at=utcnow())
+            else:
+                self._counts["retried"] += 1
+                logger.warning("Job %s (%s) attempt %s failed, will retry: %s", job.id, job.kind, job.attempts, error)
+                self._settle(job, worker_id, status="queued", last_error=error, result=result, locked_by=None,
+                             locked_until=None, run_at=utcnow() + timedelta(seconds=self.backoff(job.attempts)))
+        else:
+            self._counts["succeeded"] += 1
+            self._settle(job, worker_id, status="done", last_error=None,
+                         result=json.dumps(result) if result is not None else None,
+                         locked_until=None, finished_at=utcnow())
+        self._runs.append(time.monotonic() - started)
+        return True
+
+    def prune(self):
+        """Delete finished jobs older than ``JOB_RETENTION_SECONDS``; failed ones are kept."""
+        cutoff = utcnow() - timedelta(seconds=self.retention_seconds)
+        with SessionLocal() as session:
+            session.execute(delete(jobs).where(jobs.c.status == "done", jobs.c.finished_at < cutoff))
+            session.commit()
+
+    # -- workers -----------------------------------------------------------
+
+    def wake(self):
+        self._wake.set()
+
+    def _maybe_prune(self):
+        with self._lock:
+            if time.monotonic() - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+                return
+            self._pruned_at = time.monotonic()
+        self.prune()
+
+    def work(self, worker_id):
+        """Run jobs until ``stop()``; sleeps up to ``JOB_POLL_SECONDS`` when idle."""
+        while not self._stop.is_set():
+            try:
+                if self.run_one(worker_id):
+                    continue
+                self._maybe_prune()
+            except Exception:  # e.g. "database is locked" past the busy timeout
+                logger.exception("Job worker %s error", worker_id)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self):
+        """Start this process's workers as configured by ``JOB_WORKER_MODE``."""
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+            if self.mode == "off" or self.workers <= 0:
+                return
+            self._stop.clear()
+            if self.mode == "thread":
+                self.start_threads(self.workers)
+            elif self.mode == "process":
+                command = [sys.executable, "-m", "flask", "--app", "app:create_app", "jobs", "work", "--threads", "1"]
+                env = dict(os.environ, JOB_WORKER_MODE="off", JOB_WORKER_PARENT_PID=str(os.getpid()))
+                self._processes = [subprocess.Popen(command, env=env) for _ in range(self.workers)]
+
+    def start_threads(self, count):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for number in range(count):
+            thread = threading.Thread(
+                target=self.work, args=(f"{prefix}:{number}",), name=f"job-worker-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for process in self._processes:
+            process.terminate()
+        self._processes = []
+        self._threads = []
+        self.started = False
+
+    # -- metrics -----------------------------------------------------------
+
+    def stats(self):
+        now = utcnow()
+        with SessionLocal() as session:
+            by_status = dict(session.execute(select(jobs.c.status, func.count()).group_by(jobs.c.status)).all())
+            due = session.execute(
+                select(jobs.c.kind, func.count(), func.min(jobs.c.run_at))
+                .where(jobs.c.status == "queued", jobs.c.run_at <= now)
+                .group_by(jobs.c.kind)
+            ).all()
+        oldest = min((run_at for _, _, run_at in due), default=None)
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "by_status": by_status,
+            "due_by_kind": {kind: count for kind, count, _ in due},
+            # how long the oldest runnable job has been waiting: the queue's current latency
+            "oldest_due_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0,
+            # counters and timings for the jobs run by this process
+            "succeeded": self._counts["succeeded"],
+            "retried": self._counts["retried"],
+            "failed": self._counts["failed"],
+            "wait": _percentiles(self._waits),
+            "run": _percentiles(self._runs),
+        }
+
+
+job_queue = JobQueue()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False):
+        job_queue.wake()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+jobs_cli = AppGroup("jobs", help="Run and inspect background jobs.")
+
+
+@jobs_cli.command("work")
+@click.option("--threads", default=None, type=int, help="Worker threads (default JOB_WORKERS).")
+def work_command(threads):
+    """Run job workers in the foreground until interrupted."""
+    job_queue.start_threads(threads or job_queue.workers or 1)
+    parent_pid = os.environ.get("JOB_WORKER_PARENT_PID")
+    try:
+        while True:
+            time.sleep(1)
+            # started by an app process (JOB_WORKER_MODE=process): exit with it
+            if parent_pid and os.getppid() != int(parent_pid):
+                break
+    except KeyboardInterrupt:
+        pass
+    job_queue.stop()
+
+
+@jobs_cli.command("retry-failed")
+def retry_failed_command():
+    """Give every failed job another full set of attempts."""
+    with SessionLocal() as session:
+        count = session.execute(
+            update(jobs).where(jobs.c.status == "failed")
+            .values(status="queued", attempts=0, run_at=utcnow(), last_error=None, finished_at=None)
+        ).rowcount
+        session.commit()
+    click.echo(f"Requeued {count} failed jobs.")
+
+
+def init_app(app):
+    job_queue.configure(app.config)
+
+    @app.before_request
+    def start_job_workers():
+        if not job_queue.started:
+            job_queue.start()
@@ -0,0 +1,254 @@
+"""In-memory trigram index over vendor and raw-material names.
+
+Backs the "did you mean" suggestions on the create routes and
+``/api/search/suggest``. Each process keeps its own index: it is built once
+(warmed in the background at startup), patched from this process's own
+commits as they happen, and re-synced against the table whenever the
+table's version counter shows that another process changed it.
+
+Lookups use a prefix filter: a name can only reach the similarity threshold
+if it shares one of the query's rarest trigrams, so candidates come from the
+short posting lists, and the long ones are only intersected with them.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import bindparam, event, inspect, select, update
+
+from ..db import SessionLocal
+from ..models import RawMaterial, Vendor
+from ..names import normalize_name, trigrams
+from .versions import ALL_USERS, current_versions
+
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_REFRESH_SECONDS = 5
+
+
+class NameIndex:
+    """Trigram postings for one name table (thread-safe)."""
+
+    def __init__(self, model):
+        self.model = model
+        self.threshold = DEFAULT_THRESHOLD
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        self.version = None
+        self._names = {}
+        self._grams = {}
+        self._sizes = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def __len__(self):
+        return len(self._names)
+
+    # -- maintenance -------------------------------------------------------
+
+    def put(self, item_id, name):
+        with self._lock:
+            self._put(item_id, name)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _put(self, item_id, name):
+        if self._names.get(item_id) == name:
+            return
+        self._remove(item_id)
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        grams = frozenset(trigrams(normalized))
+        self._names[item_id] = name
+        self._grams[item_id] = grams
+        self._sizes[item_id] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(item_id)
+
+    def _remove(self, item_id):
+        self._names.pop(item_id, None)
+        self._sizes.pop(item_id, None)
+        for gram in self._grams.pop(item_id, ()):
+            posting = self._postings[gram]
+            posting.discard(item_id)
+            if not posting:
+                del self._postings[gram]
+
+    def sync(self, rows):
+        """Bring the index in line with ``(id, name)`` rows, touching only what differs."""
+        current = dict(rows)
+        with self._lock:
+            for item_id in [i for i in self._names if i not in current]:
+                self._remove(item_id)
+            for item_id, name in current.items():
+                self._put(item_id, name)
+
+    def _load(self):
+        table = self.model.__tablename__
+        with SessionLocal() as session:
+            version = current_versions(session, [table], ALL_USERS)[table]
+            rows = session.execute(select(self.model.id, self.model.name)).all()
+        self.sync(rows)
+        self.version = version
+        self._checked_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.version is not None:
+            return
+        with self._build_lock:
+            if self.version is None:
+                self._load()
+
+    def _refresh(self):
+        try:
+            self._load()
+        finally:
+            self._refreshing = False
+
+    def check_for_changes(self):
+        """Re-sync in the background if another process changed the table."""
+        now = time.monotonic()
+        if self._refreshing or now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        table = self.model.__tablename__
+        with SessionLocal() as session:
+            version = current_versions(session, [table], ALL_USERS)[table]
+        if version != self.version:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name=f"name-index-{table}", daemon=True).start()
+
+    # -- lookups -----------------------------------------------------------
+
+    def suggest(self, query, limit=5, threshold=None, exclude_id=None):
+        """Up to ``limit`` ``{"id", "name", "score"}`` dicts, best first.
+
+        ``score`` is the Jaccard similarity of the two trigram sets (1.0 for
+        names that normalize identically).
+        """
+        threshold = self.threshold if threshold is None else threshold
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        self.ensure_built()
+        self.check_for_changes()
+
+        grams = trigrams(normalized)
+        size = len(grams)
+        needed = max(1, math.ceil(threshold * size))
+        with self._lock:
+            postings = self._postings
+            rarest = sorted(grams, key=lambda g: len(postings.get(g, ())))
+            probes = size - needed + 1
+            # any name reaching the threshold shares one of the `probes` rarest trigrams...
+            shared = Counter()
+            for gram in rarest[:probes]:
+                shared.update(postings.get(gram, ()))
+            shared.pop(exclude_id, None)
+            # ...so the common trigrams are only counted for those candidates
+            candidates = set(shared)
+            for gram in rarest[probes:]:
+                shared.update(candidates.intersection(postings.get(gram, ())))
+
+            scored = []
+            sizes = self._sizes
+            for item_id, count in shared.items():
+                if count >= needed:
+                    score = count / (size + sizes[item_id] - count)
+                    if score >= threshold:
+                        scored.append((score, -item_id))
+            best = heapq.nlargest(limit, scored)
+            return [
+                {"id": -neg_id, "name": self._names[-neg_id], "score": round(score, 3)}
+                for score, neg_id in best
+            ]
+
+
+INDEXES = {
+    "vendor": NameIndex(Vendor),
+    "raw_material": NameIndex(RawMaterial),
+}
+_BY_MODEL = {index.model: index for index in INDEXES.values()}
+
+
+def suggest(kind, query, limit=5, exclude_id=None):
+    return INDEXES[kind].suggest(query, limit=limit, exclude_id=exclude_id)
+
+
+def backfill_normalized_names(bind):
+    """Fill ``normalized_name`` for rows written before the column existed."""
+    with bind.begin() as connection:
+        for model in _BY_MODEL:
+            table = model.__table__
+            rows = connection.execute(
+                select(table.c.id, table.c.name)
+                .where(table.c.normalized_name.is_(None), table.c.name.is_not(None))
+            ).all()
+            if rows:
+                connection.execute(
+                    update(table).where(table.c.id == bindparam("b_id")).values(normalized_name=bindparam("b_normalized")),
+                    [{"b_id": item_id, "b_normalized": normalize_name(name)} for item_id, name in rows],
+                )
+
+
+def note_names(session, model, pairs):
+    """Queue ``(id, name)`` pairs written with Core statements the flush hook cannot see."""
+    session.info.setdefault("name_changes", []).extend((model, item_id, name) for item_id, name in pairs)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_names(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if type(obj) in _BY_MODEL:
+            changes.append((type(obj), obj.id, obj.name))
+    for obj in session.dirty:
+        if type(obj) in _BY_MODEL and inspect(obj).attrs.name.history.has_changes():
+            changes.append((type(obj), obj.id, obj.name))
+    for obj in session.deleted:
+        if type(obj) in _BY_MODEL:
+            changes.append((type(obj), obj.id, None))
+    if changes:
+        session.info.setdefault("name_changes", []).extend(changes)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_names(session):
+    changes = session.info.pop("name_changes", ())
+    patched = set()
+    for model, item_id, name in changes:
+        index = _BY_MODEL[model]
+        if index.version is None:
+            continue
+        if name is None:
+            index.remove(item_id)
+        else:
+            index.put(item_id, name)
+        patched.add(index)
+    # the index now reflects this commit too: adopt its table version, unless
+    # another process wrote in between (then the next check re-syncs)
+    spans = session.info.get("version_spans", {})
+    for index in patched:
+        span = spans.get(index.model.__tablename__)
+        if span is not None and index.version == span[0]:
+            index.version = span[1]
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_names(session):
+    session.info.pop("name_changes", None)
+
+
+def init_app(app):
+    for index in INDEXES.values():
+        index.threshold = app.config["NAME_SUGGEST_THRESHOLD"]
+        index.refresh_seconds = app.config["NAME_INDEX_REFRESH_SECONDS"]
+    if app.config["NAME_INDEX_WARM"]:
+        for kind, index in INDEXES.items():
+            threading.Thread(target=index.ensure_built, name=f"name-index-warm-{kind}", daemon=True).start()
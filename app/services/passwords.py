@@ -0,0 +1,91 @@
+"""Password hashing off the request thread.
+
+scrypt/pbkdf2 are deliberately slow, so a burst of logins run inline ties
+up the worker's threads and CPU and starves every other endpoint. Hashes
+are computed in a small process pool instead. At most ``HASH_POOL_MAX_PENDING`` calls
+may be running or queued at once; beyond that callers get ``HashingBusy``
+straight away (served as 503 + Retry-After) rather than piling up.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt"
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the hashing queue is full; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Too many password checks in progress, try again shortly")
+        self.retry_after = retry_after
+
+
+def _method_of(password_hash):
+    return password_hash.split("$", 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.workers = 0
+        self.max_pending = 1
+        self.retry_after = 1
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(1)
+        self._lock = threading.Lock()
+        self._current_prefix = None
+
+    def configure(self, config):
+        self.method = config["PASSWORD_HASH_METHOD"]
+        self.workers = config["HASH_POOL_WORKERS"]
+        self.max_pending = config["HASH_POOL_MAX_PENDING"] or max(1, self.workers) * 4
+        self.retry_after = config["HASH_POOL_RETRY_AFTER"]
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._current_prefix = None
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy(self.retry_after)
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with other parameters than ``PASSWORD_HASH_METHOD``."""
+        if self._current_prefix is None:
+            # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1"),
+            # so read them back from a real hash once
+            self._current_prefix = _method_of(self.hash(""))
+        return _method_of(password_hash) != self._current_prefix
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+def init_app(app):
+    password_hasher.configure(app.config)
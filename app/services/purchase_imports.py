@@ -0,0 +1,227 @@
+"""Batched purchase-log import.
+
+A whole batch costs one ``IN`` lookup per name table, one multi-row insert
+per table and one inventory update per distinct material, no matter how
+many purchases it holds.
+"""
+import csv
+import io
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, insert, select, update
+
+from ..dates import parse_datetime
+from ..models import RawMaterial, RawMaterialInventoryLog, RawMaterialPurchaseLog, ReceiptEntry, Vendor
+from ..names import normalize_name
+from .name_index import note_names
+from .rollups import apply_purchase_rollups
+from .thumbnails import thumbnail_pipeline
+from .versions import record_write
+
+REQUIRED_FIELDS = ("name", "vendor", "purchaseDate", "purchaseQuantity", "purchaseUnit", "cost")
+NUMERIC_FIELDS = ("purchaseQuantity", "inventoryQuantity", "cost")
+
+# stay well below SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 500
+
+
+class InvalidImport(ValueError):
+    """Raised with a list of ``{"row": n, "error": msg}`` dicts."""
+
+    def __init__(self, errors):
+        super().__init__("Invalid purchases")
+        self.errors = errors
+
+
+def rows_from_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return [{k: (v if v != "" else None) for k, v in row.items() if k} for row in csv.DictReader(text)]
+
+
+def clean_rows(rows):
+    """Validate raw purchase dicts (same keys as the single POST route)."""
+    cleaned, errors = [], []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"row": index, "error": "Expected an object"})
+            continue
+        missing = [f for f in REQUIRED_FIELDS if row.get(f) in (None, "")]
+        if missing:
+            errors.append({"row": index, "error": f"Missing field(s): {', '.join(missing)}"})
+            continue
+        try:
+            row = dict(row)
+            for field in NUMERIC_FIELDS:
+                row[field] = float(row[field]) if row.get(field) not in (None, "") else 0.0
+            row["purchaseDate"] = parse_datetime(row["purchaseDate"])
+        except (TypeError, ValueError) as e:
+            errors.append({"row": index, "error": str(e)})
+            continue
+        row["name"] = str(row["name"]).strip()
+        row["vendor"] = str(row["vendor"]).strip()
+        # rows are matched to existing vendors/materials (and to each other) by these keys
+        row["nameKey"] = normalize_name(row["name"])
+        row["vendorKey"] = normalize_name(row["vendor"])
+        if not row["nameKey"] or not row["vendorKey"]:
+            errors.append({"row": index, "error": "name and vendor must contain letters or digits"})
+            continue
+        cleaned.append(row)
+    if errors:
+        raise InvalidImport(errors)
+    return cleaned
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _ids_by_key(session, model, keys):
+    found = {}
+    for chunk in _chunks(keys):
+        found.update(session.execute(
+            select(model.normalized_name, model.id).where(model.normalized_name.in_(chunk))
+        ).all())
+    return found
+
+
+def _first_rows_by(rows, key):
+    firsts = OrderedDict()
+    for row in rows:
+        firsts.setdefault(row[key], row)
+    return firsts
+
+
+def import_purchases(session, user_id, rows):
+    """Insert ``rows`` (already cleaned) for ``user_id``; the caller commits."""
+    now = datetime.now()
+    summary = {"purchase_logs_created": len(rows), "vendors_created": 0, "raw_materials_created": 0}
+    if not rows:
+        return summary
+
+    # vendors
+    vendor_rows = _first_rows_by(rows, "vendorKey")
+    vendor_ids = _ids_by_key(session, Vendor, vendor_rows)
+    new_vendors = [
+        {
+            "name": r["vendor"],
+            "normalized_name": key,
+            "phone": r.get("vendorPhone"),
+            "email": r.get("vendorEmail"),
+            "website": r.get("vendorWebsite"),
+        }
+        for key, r in vendor_rows.items() if key not in vendor_ids
+    ]
+    if new_vendors:
+        created = session.execute(
+            insert(Vendor).returning(Vendor.normalized_name, Vendor.id, Vendor.name), new_vendors
+        ).all()
+        vendor_ids.update((key, vendor_id) for key, vendor_id, _ in created)
+        note_names(session, Vendor, [(vendor_id, name) for _, vendor_id, name in created])
+        record_write(session, Vendor.__tablename__)
+        summary["vendors_created"] = len(new_vendors)
+
+    # raw materials, with their inventory logs
+    material_rows = _first_rows_by(rows, "nameKey")
+    material_ids = _ids_by_key(session, RawMaterial, material_rows)
+    deltas = {}
+    for row in rows:
+        deltas[row["nameKey"]] = deltas.get(row["nameKey"], 0.0) + row["inventoryQuantity"]
+
+    new_materials = [
+        {
+            "name": r["name"],
+            "normalized_name": key,
+            "category": r.get("category"),
+            "subcategory": r.get("subcategory"),
+            "created_at": now,
+        }
+        for key, r in material_rows.items() if key not in material_ids
+    ]
+    if new_materials:
+        created = session.execute(
+            insert(RawMaterial).returning(RawMaterial.normalized_name, RawMaterial.id, RawMaterial.name), new_materials
+        ).all()
+        material_ids.update((key, item_id) for key, item_id, _ in created)
+        note_names(session, RawMaterial, [(item_id, name) for _, item_id, name in created])
+        session.execute(insert(RawMaterialInventoryLog), [
+            {
+                "item_id": item_id,
+                "amount_on_hand": deltas.pop(key),
+                "amount_on_hand_unit": material_rows[key].get("inventoryUnit"),
+                "created_at": now,
+                "last_updated": now,
+            }
+            for key, item_id, _ in created
+        ])
+        record_write(session, RawMaterial.__tablename__)
+        summary["raw_materials_created"] = len(new_materials)
+
+    # one aggregated inventory update per pre-existing material
+    if deltas:
+        inventory_table = RawMaterialInventoryLog.__table__
+        session.connection().execute(
+            update(inventory_table)
+            .where(inventory_table.c.item_id == bindparam("b_item_id"))
+            .values(
+                amount_on_hand=func.coalesce(inventory_table.c.amount_on_hand, 0) + bindparam("b_delta"),
+                last_updated=now,
+            ),
+            [{"b_item_id": material_ids[key], "b_delta": delta} for key, delta in deltas.items()],
+        )
+    if deltas or new_materials:
+        record_write(session, RawMaterialInventoryLog.__tablename__)
+
+    inventory_ids = {}
+    for chunk in _chunks(material_ids.values()):
+        inventory_ids.update(session.execute(
+            select(RawMaterialInventoryLog.item_id, RawMaterialInventoryLog.id)
+            .where(RawMaterialInventoryLog.item_id.in_(chunk))
+        ).all())
+
+    # receipts, for the purchases that reference an uploaded image
+    receipt_positions = [i for i, r in enumerate(rows) if r.get("imageUrl") or r.get("filename")]
+    receipt_ids = {}
+    if receipt_positions:
+        ids = session.execute(
+            insert(ReceiptEntry).returning(ReceiptEntry.id, sort_by_parameter_order=True),
+            [
+                {
+                    "date": rows[i]["purchaseDate"],
+                    "filename": rows[i].get("filename"),
+                    "image_url": rows[i].get("imageUrl"),
+                    "created_at": now,
+                    "memo": rows[i].get("receiptMemo"),
+                    "vendor_id": vendor_ids[rows[i]["vendorKey"]],
+                    "user_id": user_id,
+                }
+                for i in receipt_positions
+            ],
+        ).scalars().all()
+        receipt_ids = dict(zip(receipt_positions, ids))
+        record_write(session, ReceiptEntry.__tablename__, [user_id])
+        thumbnail_pipeline.queue(session, [receipt_ids[i] for i in receipt_positions if rows[i].get("filename")])
+
+    purchase_logs = [
+        {
+            "brand": row.get("brand"),
+            "log_date": now,
+            "purchase_date": row["purchaseDate"],
+            "purchase_amount": row["purchaseQuantity"],
+            "purchase_unit": row["purchaseUnit"],
+            "cost": row["cost"],
+            "notes": row.get("notes"),
+            "receipt_entry_id": receipt_ids.get(i),
+            "inventory_log_id": inventory_ids.get(material_ids[row["nameKey"]]),
+            "item_id": material_ids[row["nameKey"]],
+            "vendor_id": vendor_ids[row["vendorKey"]],
+            "user_id": user_id,
+        }
+        for i, row in enumerate(rows)
+    ]
+    session.execute(insert(RawMaterialPurchaseLog), purchase_logs)
+    apply_purchase_rollups(session, purchase_logs)
+    record_write(session, RawMaterialPurchaseLog.__tablename__, [user_id])
+    return summary
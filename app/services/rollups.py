@@ -0,0 +1,201 @@
+"""Spend rollups maintained alongside raw material purchase logs.
+
+Every flush that inserts, updates or deletes purchase logs turns the change
+into signed deltas and upserts them into the per-material, per-vendor and
+per-month tables in the same transaction. Core-level writes (the bulk
+import) call ``apply_purchase_rollups`` themselves. ``rebuild_rollups``
+recomputes everything from scratch for repairs, inline or as a queued
+``rebuild_rollups`` job (``flask rollups rebuild --queue``).
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, inspect, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..db import SessionLocal
+from ..models import MaterialSpendRollup, MonthlySpendRollup, RawMaterialPurchaseLog, VendorSpendRollup
+from .jobs import enqueue, handler
+from .time_rollups import rebuild_task_time_buckets
+from .versions import record_write
+
+TRACKED_FIELDS = ("user_id", "item_id", "vendor_id", "purchase_date", "purchase_amount", "purchase_unit", "cost")
+
+
+def month_of(value):
+    """``YYYY-MM`` for a purchase date, matching ``substr(purchase_date, 1, 7)`` in SQL."""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m")
+    if isinstance(value, str) and len(value) >= 7:
+        return value[:7]
+    return None
+
+
+class RollupDeltas:
+    def __init__(self):
+        self.by_material = {}
+        self.by_vendor = {}
+        self.by_month = {}
+
+    def __bool__(self):
+        return bool(self.by_material or self.by_vendor or self.by_month)
+
+    def add(self, values, sign):
+        user_id = values.get("user_id")
+        if user_id is None:
+            return
+        user_id = int(user_id)
+        cost = (values.get("cost") or 0) * sign
+        quantity = (values.get("purchase_amount") or 0) * sign
+
+        if values.get("item_id") is not None:
+            key = (user_id, values["item_id"], values.get("purchase_unit") or "")
+            totals = self.by_material.setdefault(key, [0.0, 0.0, 0])
+            totals[0] += cost
+            totals[1] += quantity
+            totals[2] += sign
+        if values.get("vendor_id") is not None:
+            totals = self.by_vendor.setdefault((user_id, values["vendor_id"]), [0.0, 0])
+            totals[0] += cost
+            totals[1] += sign
+        month = month_of(values.get("purchase_date"))
+        if month is not None:
+            totals = self.by_month.setdefault((user_id, month), [0.0, 0])
+            totals[0] += cost
+            totals[1] += sign
+
+    def apply(self, connection):
+        _upsert(connection, MaterialSpendRollup, ["user_id", "item_id", "purchase_unit"], [
+            {"user_id": u, "item_id": i, "purchase_unit": unit,
+             "total_cost": c, "total_quantity": q, "purchase_count": n}
+            for (u, i, unit), (c, q, n) in self.by_material.items()
+        ])
+        _upsert(connection, VendorSpendRollup, ["user_id", "vendor_id"], [
+            {"user_id": u, "vendor_id": v, "total_cost": c, "purchase_count": n}
+            for (u, v), (c, n) in self.by_vendor.items()
+        ])
+        _upsert(connection, MonthlySpendRollup, ["user_id", "month"], [
+            {"user_id": u, "month": m, "total_cost": c, "purchase_count": n}
+            for (u, m), (c, n) in self.by_month.items()
+        ])
+        # groups whose last purchase went away
+        for model in (MaterialSpendRollup, VendorSpendRollup, MonthlySpendRollup):
+            connection.execute(delete(model.__table__).where(model.__table__.c.purchase_count <= 0))
+
+
+def _upsert(connection, model, key_columns, rows):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = insert(table)
+    totals = [c for c in rows[0] if c not in key_columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={c: table.c[c] + stmt.excluded[c] for c in totals},
+    )
+    connection.execute(stmt, rows)
+
+
+def apply_purchase_rollups(session, rows, sign=1):
+    """Fold plain purchase-log value dicts into the rollups."""
+    deltas = RollupDeltas()
+    for row in rows:
+        deltas.add(row, sign)
+    if deltas:
+        deltas.apply(session.connection())
+
+
+def _current_values(obj):
+    return {f: getattr(obj, f) for f in TRACKED_FIELDS}
+
+
+def _previous_values(obj):
+    attrs = inspect(obj).attrs
+    values = {}
+    for f in TRACKED_FIELDS:
+        history = attrs[f].history
+        if history.deleted:
+            values[f] = history.deleted[0]
+        elif history.unchanged:
+            values[f] = history.unchanged[0]
+        else:
+            values[f] = None
+    return values
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_purchase_logs(session, flush_context):
+    deltas = RollupDeltas()
+    for obj in session.new:
+        if isinstance(obj, RawMaterialPurchaseLog):
+            deltas.add(_current_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, RawMaterialPurchaseLog):
+            deltas.add(_previous_values(obj), -1)
+    for obj in session.dirty:
+        if isinstance(obj, RawMaterialPurchaseLog) and session.is_modified(obj, include_collections=False):
+            previous, current = _previous_values(obj), _current_values(obj)
+            if previous != current:
+                deltas.add(previous, -1)
+                deltas.add(current, 1)
+    if deltas:
+        deltas.apply(session.connection())
+
+
+def rebuild_rollups(session):
+    """Recompute every rollup from the purchase logs; the caller commits."""
+    logs = RawMaterialPurchaseLog.__table__.c
+    models = (MaterialSpendRollup, VendorSpendRollup, MonthlySpendRollup)
+    # users whose rollups vanish or change, so their cached summaries go stale
+    owners = set(session.execute(select(logs.user_id).distinct()).scalars())
+    for model in models:
+        owners.update(session.execute(select(model.user_id).distinct()).scalars())
+        session.execute(delete(model.__table__))
+
+    session.execute(insert(MaterialSpendRollup.__table__).from_select(
+        ["user_id", "item_id", "purchase_unit", "total_cost", "total_quantity", "purchase_count"],
+        select(
+            logs.user_id, logs.item_id, func.coalesce(logs.purchase_unit, literal("")),
+            func.total(logs.cost), func.total(logs.purchase_amount), func.count(),
+        ).group_by(logs.user_id, logs.item_id, func.coalesce(logs.purchase_unit, literal(""))),
+    ))
+    session.execute(insert(VendorSpendRollup.__table__).from_select(
+        ["user_id", "vendor_id", "total_cost", "purchase_count"],
+        select(logs.user_id, logs.vendor_id, func.total(logs.cost), func.count())
+        .group_by(logs.user_id, logs.vendor_id),
+    ))
+    month = func.substr(logs.purchase_date, 1, 7)
+    session.execute(insert(MonthlySpendRollup.__table__).from_select(
+        ["user_id", "month", "total_cost", "purchase_count"],
+        select(logs.user_id, month, func.total(logs.cost), func.count())
+        .where(logs.purchase_date.isnot(None))
+        .group_by(logs.user_id, month),
+    ))
+    for model in models:
+        record_write(session, model.__tablename__, owners)
+
+
+rollups_cli = AppGroup("rollups", help="Maintain the spend and task time rollups.")
+
+
+@handler("rebuild_rollups")
+def _rebuild_job(payload):
+    with SessionLocal() as session:
+        rebuild_rollups(session)
+        rebuild_task_time_buckets(session)
+        session.commit()
+
+
+@rollups_cli.command("rebuild")
+@click.option("--queue", is_flag=True, help="Queue the rebuild as a background job instead.")
+def rebuild_command(queue):
+    """Recompute the spend rollups and task time buckets from their source rows."""
+    if queue:
+        with SessionLocal() as session:
+            enqueue(session, "rebuild_rollups")
+            session.commit()
+        click.echo("Rollup rebuild queued.")
+        return
+    _rebuild_job({})
+    click.echo("Spend rollups and task time buckets rebuilt.")
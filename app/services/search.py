@@ -0,0 +1,164 @@
+"""Full-text search over materials, vendors, purchase notes, receipts and tasks.
+
+A single SQLite FTS5 table holds one document per source row. Triggers on
+the source tables keep it in sync for every write path, ORM or Core. The
+FTS rowid encodes ``(entity, id)`` so trigger updates and deletes are
+rowid lookups rather than scans.
+"""
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+
+from ..db import Base, engine
+
+SEARCH_TABLE = "search_index"
+ROWID_STRIDE = 8
+
+# entity_type -> source table, rowid code, and SQL for each indexed field
+# ({r} is NEW/OLD inside triggers, or the table name when backfilling)
+ENTITIES = {
+    "raw_material": {
+        "table": "raw_materials",
+        "code": 1,
+        "title": "coalesce({r}.name, '')",
+        "body": "trim(coalesce({r}.category, '') || ' ' || coalesce({r}.subcategory, ''))",
+        "user_id": "NULL",
+    },
+    "vendor": {
+        "table": "vendors",
+        "code": 2,
+        "title": "coalesce({r}.name, '')",
+        "body": "trim(coalesce({r}.email, '') || ' ' || coalesce({r}.website, ''))",
+        "user_id": "NULL",
+    },
+    "purchase_log": {
+        "table": "raw_material_purchase_logs",
+        "code": 3,
+        "title": "coalesce({r}.brand, '')",
+        "body": "coalesce({r}.notes, '')",
+        "user_id": "{r}.user_id",
+    },
+    "receipt": {
+        "table": "receipt_entries",
+        "code": 4,
+        "title": "coalesce({r}.filename, '')",
+        "body": "coalesce({r}.memo, '')",
+        "user_id": "{r}.user_id",
+    },
+    "task": {
+        "table": "tasks",
+        "code": 5,
+        "title": "coalesce({r}.name, '')",
+        "body": "trim(coalesce({r}.description, '') || ' ' || coalesce({r}.memo, ''))",
+        "user_id": "{r}.user_id",
+    },
+}
+
+
+def _rowid(spec, r):
+    return f"{r}.id * {ROWID_STRIDE} + {spec['code']}"
+
+
+def _insert_sql(entity_type, spec, r):
+    return (
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, body, entity_type, entity_id, user_id) "
+        f"SELECT {_rowid(spec, r)}, {spec['title'].format(r=r)}, {spec['body'].format(r=r)}, "
+        f"'{entity_type}', {r}.id, {spec['user_id'].format(r=r)}"
+    )
+
+
+def _delete_sql(spec):
+    return f"DELETE FROM {SEARCH_TABLE} WHERE rowid = {_rowid(spec, 'old')}"
+
+
+def search_ddl():
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "title, body, entity_type UNINDEXED, entity_id UNINDEXED, user_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ]
+    for entity_type, spec in ENTITIES.items():
+        table = spec["table"]
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"{_insert_sql(entity_type, spec, 'new')}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN "
+            f"{_delete_sql(spec)}; {_insert_sql(entity_type, spec, 'new')}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"{_delete_sql(spec)}; END",
+        ]
+    return statements
+
+
+def rebuild_search_index(connection):
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    for entity_type, spec in ENTITIES.items():
+        connection.execute(text(f"{_insert_sql(entity_type, spec, spec['table'])} FROM {spec['table']}"))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def install_search_index(target, connection, **kw):
+    """Create the FTS table and triggers (idempotent); backfill on first install."""
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+    ).first()
+    for statement in search_ddl():
+        connection.execute(text(statement))
+    if not exists:
+        rebuild_search_index(connection)
+
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(query):
+    """FTS5 MATCH string where every word is a required prefix term."""
+    tokens = _TOKEN.findall(query or "")
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def search(session, query, user_id, entity_types=None, limit=20, offset=0):
+    """Ranked hits visible to ``user_id`` (their own rows plus shared ones).
+
+    Returns ``(hits, has_more)``.
+    """
+    match = match_expression(query)
+    if not match:
+        return [], False
+
+    params = {"match": match, "user_id": user_id, "limit": limit + 1, "offset": offset}
+    type_filter = ""
+    if entity_types:
+        names = [f":type_{i}" for i in range(len(entity_types))]
+        type_filter = f"AND entity_type IN ({', '.join(names)})"
+        params.update({f"type_{i}": t for i, t in enumerate(entity_types)})
+
+    rows = session.execute(text(
+        f"SELECT entity_type, entity_id, title, "
+        f"snippet({SEARCH_TABLE}, 1, '[', ']', '…', 12) AS snippet, "
+        f"bm25({SEARCH_TABLE}, 10.0, 1.0) AS rank "
+        f"FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH :match AND (user_id IS NULL OR user_id = :user_id) {type_filter} "
+        f"ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), params).all()
+
+    hits = [
+        {"type": r.entity_type, "id": r.entity_id, "title": r.title, "snippet": r.snippet, "score": -r.rank}
+        for r in rows[:limit]
+    ]
+    return hits, len(rows) > limit
+
+
+search_cli = AppGroup("search", help="Maintain the full-text search index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Repopulate the search index from every source table."""
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+    click.echo("Search index rebuilt.")
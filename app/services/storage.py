@@ -0,0 +1,205 @@
+"""Object storage (Cloudflare R2, or any S3-compatible endpoint) for receipts.
+
+The boto3 client is built on first use rather than at import time. That
+keeps boto3's import and client setup off every worker's cold start and
+every CLI run, and the app starts without storage credentials. The client
+is thread-safe and shared, with a connection pool sized by
+``STORAGE_MAX_POOL_CONNECTIONS``, so concurrent requests reuse TLS
+connections instead of opening their own.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .jobs import JobError, enqueue, handler
+
+# S3/R2 accept at most 1000 keys per DeleteObjects call
+DELETE_BATCH_SIZE = 1000
+
+
+class StorageError(RuntimeError):
+    """A failed storage call.
+
+    ``rejected`` is True when the store refused the request (bad upload id,
+    missing key, ...) rather than being unreachable or misconfigured.
+    """
+
+    def __init__(self, message, rejected=False):
+        super().__init__(message)
+        self.rejected = rejected
+
+
+def owns_key(user_id, object_key):
+    """True for keys under ``user_id``'s prefix (see ``new_object_key`` in the receipt routes)."""
+    return isinstance(object_key, str) and object_key.startswith(f"user_{user_id}_")
+
+
+class ObjectStorage:
+    def __init__(self):
+        self.bucket = None
+        self.account_id = None
+        self.access_key_id = None
+        self.secret_access_key = None
+        self.endpoint_url = None
+        self.max_pool_connections = 32
+        self.delete_workers = 8
+        self._client = None
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.bucket = config["STORAGE_BUCKET"]
+        self.account_id = config["STORAGE_ACCOUNT_ID"]
+        self.access_key_id = config["STORAGE_ACCESS_KEY_ID"]
+        self.secret_access_key = config["STORAGE_SECRET_ACCESS_KEY"]
+        self.endpoint_url = config["STORAGE_ENDPOINT_URL"] or f"https://{self.account_id}.r2.cloudflarestorage.com"
+        self.max_pool_connections = config["STORAGE_MAX_POOL_CONNECTIONS"]
+        self.delete_workers = config["STORAGE_DELETE_WORKERS"]
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config as BotoConfig
+
+                    self._client = boto3.session.Session().client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        aws_access_key_id=self.access_key_id,
+                        aws_secret_access_key=self.secret_access_key,
+                        region_name="auto",
+                        config=BotoConfig(
+                            max_pool_connections=self.max_pool_connections,
+                            retries={"max_attempts": 3, "mode": "standard"},
+                        ),
+                    )
+        return self._client
+
+    def _call(self, operation, **kwargs):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            return getattr(self.client, operation)(Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            raise StorageError(str(e), rejected=True) from e
+        except BotoCoreError as e:
+            raise StorageError(str(e)) from e
+
+    def _sign(self, operation, expires_in, **params):
+        from botocore.exceptions import BotoCoreError
+
+        try:
+            return self.client.generate_presigned_url(
+                ClientMethod=operation,
+                Params={"Bucket": self.bucket, **params},
+                ExpiresIn=expires_in,
+                HttpMethod="PUT",
+            )
+        except BotoCoreError as e:
+            raise StorageError(str(e)) from e
+
+    # -- public API --------------------------------------------------------
+
+    def public_url(self, key):
+        return f"https://pub-{self.account_id}.r2.dev/{key}"
+
+    def sign_put(self, key, content_type=None, expires_in=300):
+        params = {"Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return self._sign("put_object", expires_in, **params)
+
+    def sign_upload_part(self, key, upload_id, part_number, expires_in=300):
+        return self._sign("upload_part", expires_in, Key=key, UploadId=upload_id, PartNumber=part_number)
+
+    def create_multipart_upload(self, key, content_type=None):
+        params = {"Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return self._call("create_multipart_upload", **params)["UploadId"]
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        """``parts`` is ``[{"PartNumber": n, "ETag": etag}, ...]`` in part order."""
+        self._call("complete_multipart_upload", Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+
+    def abort_multipart_upload(self, key, upload_id):
+        self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+
+    def get_object(self, key, max_bytes=None):
+        """The object's bytes; refuses (rejected) objects larger than ``max_bytes``."""
+        response = self._call("get_object", Key=key)
+        body = response["Body"]
+        try:
+            if max_bytes is not None and response.get("ContentLength", 0) > max_bytes:
+                raise StorageError(f"{key} is larger than {max_bytes} bytes", rejected=True)
+            return body.read()
+        finally:
+            body.close()
+
+    def put_object(self, key, body, content_type=None, cache_control=None):
+        params = {"Key": key, "Body": body}
+        if content_type:
+            params["ContentType"] = content_type
+        if cache_control:
+            params["CacheControl"] = cache_control
+        self._call("put_object", **params)
+
+    def _delete_batch(self, keys):
+        try:
+            response = self._call(
+                "delete_objects", Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+        except StorageError as e:
+            return {key: str(e) for key in keys}
+        # quiet mode lists only the keys that failed
+        return {error["Key"]: error.get("Message") or error.get("Code") for error in response.get("Errors", [])}
+
+    def delete_many(self, keys):
+        """Delete ``keys`` in batches of 1000, sending the batches concurrently.
+
+        Returns ``(deleted, failed)``: the keys that are gone, and a dict of
+        ``key -> error message`` for the ones that could not be deleted. A key
+        that did not exist counts as deleted.
+        """
+        keys = list(dict.fromkeys(keys))
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        failed = {}
+        if len(batches) == 1:
+            failed.update(self._delete_batch(batches[0]))
+        elif batches:
+            workers = max(1, min(self.delete_workers, len(batches), self.max_pool_connections))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage-delete") as pool:
+                for batch_failed in pool.map(self._delete_batch, batches):
+                    failed.update(batch_failed)
+        deleted = [key for key in keys if key not in failed]
+        return deleted, failed
+
+
+storage = ObjectStorage()
+
+
+def queue_deletes(session, keys, user_id=None):
+    """Delete ``keys`` in the background once ``session`` commits; returns the job id.
+
+    One job covers every key, so ``delete_many`` can send the 1000-key
+    batches concurrently. Its result lists what was deleted and what failed.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return None
+    return enqueue(session, "delete_objects", {"keys": keys, "user_id": user_id})
+
+
+@handler("delete_objects")
+def _delete_objects_job(payload):
+    # deleting a key that is already gone succeeds, so a retry can resend every key
+    deleted, failed = storage.delete_many(payload["keys"])
+    result = {"deleted": deleted, "failed": failed}
+    if failed:
+        raise JobError(f"{len(failed)} of {len(payload['keys'])} keys not deleted", result=result)
+    return result
+
+
+def init_app(app):
+    storage.configure(app.config)
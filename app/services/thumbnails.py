@@ -0,0 +1,196 @@
+"""Downscaled previews of uploaded receipt images.
+
+Receipt lists only need a small preview, but the original photo is often
+several megabytes. Committing a receipt row with an uploaded image queues a
+``receipt_thumbnail`` job (see ``jobs``) that fetches the image from
+storage, shrinks it to fit ``THUMBNAIL_MAX_SIZE``, saves it next to the
+original as WebP and JPEG and fills in ``thumbnail_url`` /
+``thumbnail_jpeg_url``. Decoding and resizing is CPU-bound, so it runs in a
+process pool of ``THUMBNAIL_WORKERS`` (0 renders on the job worker itself).
+
+Pillow is optional: without it no jobs are queued and clients keep falling
+back to ``image_url``. ``flask thumbnails backfill`` queues receipts that
+were uploaded before the pipeline existed or whose generation failed.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, select, update
+
+from ..db import SessionLocal
+from ..models import ReceiptEntry
+from .jobs import enqueue_many, handler
+from .storage import owns_key, storage
+from .versions import record_write
+
+DEFAULT_MAX_SIZE = 320
+DEFAULT_QUALITY = 75
+# previews never change once written, so clients and CDNs may keep them
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FORMATS = (("webp", "WEBP", "image/webp"), ("jpg", "JPEG", "image/jpeg"))
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailsUnavailable(RuntimeError):
+    pass
+
+
+def _image_module():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # pragma: no cover - Pillow is optional
+        raise ThumbnailsUnavailable("Receipt thumbnails need Pillow installed")
+    return Image, ImageOps
+
+
+def thumbnail_keys(object_key):
+    """``{"webp": key, "jpg": key}`` of the previews stored next to ``object_key``."""
+    stem, dot, extension = object_key.rpartition(".")
+    if not dot or "/" in extension:
+        stem = object_key
+    return {extension: f"{stem}_thumb.{extension}" for extension, _, _ in FORMATS}
+
+
+def render_thumbnails(data, max_size, quality):
+    """``{"webp": bytes, "jpg": bytes}`` for the image in ``data``; runs in the process pool."""
+    Image, ImageOps = _image_module()
+    with Image.open(io.BytesIO(data)) as image:
+        # lets the JPEG decoder scale down by 1/2..1/8 while decoding, which is
+        # most of the saving on large photos
+        image.draft("RGB", (max_size, max_size))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        rendered = {}
+        for extension, pil_format, _ in FORMATS:
+            out = io.BytesIO()
+            image.save(out, pil_format, quality=quality, optimize=True)
+            rendered[extension] = out.getvalue()
+    return rendered
+
+
+class ThumbnailPipeline:
+    def __init__(self):
+        self.enabled = True
+        self.workers = 0
+        self.max_size = DEFAULT_MAX_SIZE
+        self.quality = DEFAULT_QUALITY
+        self.max_source_bytes = None
+        self._processes = None
+        self._available = None
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.enabled = config["THUMBNAILS_ENABLED"]
+        self.workers = config["THUMBNAIL_WORKERS"]
+        self.max_size = config["THUMBNAIL_MAX_SIZE"]
+        self.quality = config["THUMBNAIL_QUALITY"]
+        self.max_source_bytes = config["THUMBNAIL_MAX_SOURCE_BYTES"]
+
+    @property
+    def available(self):
+        if self._available is None:
+            try:
+                _image_module()
+                self._available = True
+            except ThumbnailsUnavailable as e:
+                logger.warning("Receipt thumbnails disabled: %s", e)
+                self._available = False
+        return self._available
+
+    def _pool(self):
+        if self._processes is None:
+            with self._lock:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.workers)
+        return self._processes
+
+    def _render(self, data):
+        if self.workers <= 0:
+            return render_thumbnails(data, self.max_size, self.quality)
+        return self._pool().submit(render_thumbnails, data, self.max_size, self.quality).result()
+
+    def generate(self, receipt_id):
+        """Make and record the previews for one receipt; False if there is nothing to do."""
+        with SessionLocal() as session:
+            row = session.execute(
+                select(ReceiptEntry.filename, ReceiptEntry.thumbnail_url, ReceiptEntry.user_id)
+                .where(ReceiptEntry.id == receipt_id)
+            ).first()
+            # filename comes from the client: never read (or write next to) another user's objects
+            if row is None or row.thumbnail_url or not owns_key(row.user_id, row.filename):
+                return False
+
+            rendered = self._render(storage.get_object(row.filename, max_bytes=self.max_source_bytes))
+            keys = thumbnail_keys(row.filename)
+            for extension, _, content_type in FORMATS:
+                storage.put_object(keys[extension], rendered[extension], content_type, THUMBNAIL_CACHE_CONTROL)
+
+            session.execute(
+                update(ReceiptEntry)
+                .where(ReceiptEntry.id == receipt_id)
+                .values(
+                    thumbnail_url=storage.public_url(keys["webp"]),
+                    thumbnail_jpeg_url=storage.public_url(keys["jpg"]),
+                )
+            )
+            record_write(session, ReceiptEntry.__tablename__, [row.user_id])
+            session.commit()
+        return True
+
+    def queue(self, session, receipt_ids):
+        """Queue preview jobs for ``receipt_ids`` in ``session``'s transaction."""
+        if receipt_ids and self.enabled and self.available:
+            enqueue_many(session, "receipt_thumbnail", [{"receipt_id": receipt_id} for receipt_id in receipt_ids])
+
+    def shutdown(self):
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+
+thumbnail_pipeline = ThumbnailPipeline()
+
+
+@handler("receipt_thumbnail")
+def _thumbnail_job(payload):
+    Image, _ = _image_module()
+    try:
+        thumbnail_pipeline.generate(payload["receipt_id"])
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        # not an image we can preview (a PDF, say); retrying will not help
+        logger.info("No thumbnail for receipt %s: %s", payload["receipt_id"], e)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _queue_new_receipts(session, flush_context):
+    receipt_ids = [obj.id for obj in session.new if isinstance(obj, ReceiptEntry) and obj.filename]
+    if receipt_ids:
+        thumbnail_pipeline.queue(session, receipt_ids)
+
+
+thumbnails_cli = AppGroup("thumbnails", help="Maintain receipt image previews.")
+
+
+@thumbnails_cli.command("backfill")
+def backfill_command():
+    """Queue previews for every receipt image that has none yet."""
+    if not thumbnail_pipeline.available:
+        raise click.ClickException("Receipt thumbnails need Pillow installed")
+    with SessionLocal() as session:
+        receipt_ids = session.execute(
+            select(ReceiptEntry.id)
+            .where(ReceiptEntry.filename.is_not(None), ReceiptEntry.thumbnail_url.is_(None))
+            .order_by(ReceiptEntry.id)
+        ).scalars().all()
+        thumbnail_pipeline.queue(session, receipt_ids)
+        session.commit()
+    click.echo(f"Queued previews for {len(receipt_ids)} receipts.")
+
+
+def init_app(app):
+    thumbnail_pipeline.configure(app.config)
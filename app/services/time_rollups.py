@@ -0,0 +1,135 @@
+"""Per-user task time totals by day, week and month.
+
+Each task's ``[start_datetime, end_datetime)`` interval is split at bucket
+boundaries, so a task running past midnight (or across a week or month
+edge) adds the right share to each bucket. Buckets are in the same clock
+as the stored datetimes (naive UTC) and weeks start on Monday.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..db import SessionLocal
+from ..models import Task, TaskTimeBucket
+from .versions import record_write
+
+GRANULARITIES = ("day", "week", "month")
+TRACKED_FIELDS = ("user_id", "start_datetime", "end_datetime")
+
+
+def bucket_start(moment, granularity):
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+
+def next_bucket(start, granularity):
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def split_interval(start, end, granularity):
+    """Yield ``(bucket_start, seconds)`` for the part of ``[start, end)`` in each bucket."""
+    current = bucket_start(start, granularity)
+    while current < end:
+        following = next_bucket(current, granularity)
+        overlap = (min(end, following) - max(start, current)).total_seconds()
+        if overlap > 0:
+            yield current, overlap
+        current = following
+
+
+class TimeDeltas:
+    def __init__(self):
+        self.totals = {}
+
+    def __bool__(self):
+        return bool(self.totals)
+
+    def add(self, values, sign):
+        user_id, start, end = values["user_id"], values["start_datetime"], values["end_datetime"]
+        if user_id is None or not isinstance(start, datetime) or not isinstance(end, datetime) or end <= start:
+            return
+        for granularity in GRANULARITIES:
+            for bucket, seconds in split_interval(start, end, granularity):
+                totals = self.totals.setdefault((int(user_id), granularity, bucket), [0.0, 0])
+                totals[0] += seconds * sign
+                totals[1] += sign
+
+    def apply(self, connection):
+        table = TaskTimeBucket.__table__
+        rows = [
+            {"user_id": u, "granularity": g, "bucket_start": b, "total_seconds": s, "task_count": n}
+            for (u, g, b), (s, n) in self.totals.items()
+        ]
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "granularity", "bucket_start"],
+            set_={
+                "total_seconds": table.c.total_seconds + stmt.excluded.total_seconds,
+                "task_count": table.c.task_count + stmt.excluded.task_count,
+            },
+        )
+        connection.execute(stmt, rows)
+        connection.execute(delete(table).where(table.c.task_count <= 0))
+
+
+def _values(obj, previous=False):
+    if not previous:
+        return {f: getattr(obj, f) for f in TRACKED_FIELDS}
+    attrs = inspect(obj).attrs
+    values = {}
+    for f in TRACKED_FIELDS:
+        history = attrs[f].history
+        if history.deleted:
+            values[f] = history.deleted[0]
+        elif history.unchanged:
+            values[f] = history.unchanged[0]
+        else:
+            values[f] = None
+    return values
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_tasks(session, flush_context):
+    deltas = TimeDeltas()
+    for obj in session.new:
+        if isinstance(obj, Task):
+            deltas.add(_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            deltas.add(_values(obj, previous=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Task) and session.is_modified(obj, include_collections=False):
+            previous, current = _values(obj, previous=True), _values(obj)
+            if previous != current:
+                deltas.add(previous, -1)
+                deltas.add(current, 1)
+    if deltas:
+        deltas.apply(session.connection())
+
+
+def rebuild_task_time_buckets(session, batch_size=1000):
+    """Recompute every bucket from the tasks; the caller commits."""
+    owners = set(session.execute(select(TaskTimeBucket.user_id).distinct()).scalars())
+    owners.update(session.execute(select(Task.user_id).distinct()).scalars())
+    session.execute(delete(TaskTimeBucket.__table__))
+    stmt = select(Task.user_id, Task.start_datetime, Task.end_datetime).execution_options(yield_per=batch_size)
+    for partition in session.execute(stmt).partitions():
+        deltas = TimeDeltas()
+        for row in partition:
+            deltas.add(row._asdict(), 1)
+        if deltas:
+            deltas.apply(session.connection())
+    record_write(session, TaskTimeBucket.__tablename__, owners)
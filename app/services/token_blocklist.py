@@ -0,0 +1,178 @@
+"""Revoked JWTs, persisted in SQLite and shared by every worker.
+
+Each process mirrors the table in memory: a dict of ``jti -> expiry``
+fronted by a Bloom filter, so the check run on every authenticated request
+is a few bit tests for the (overwhelmingly common) token that was never
+revoked. The mirror catches up with revocations made by other workers by
+fetching rows past the last id it has seen, at most once per
+``JWT_BLOCKLIST_REFRESH_SECONDS``. A background thread deletes entries
+whose tokens have expired anyway.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..db import SessionLocal
+from ..models import TokenBlocklist
+
+DEFAULT_REFRESH_SECONDS = 1.0
+DEFAULT_PRUNE_SECONDS = 600
+DEFAULT_CAPACITY = 100_000
+FALSE_POSITIVE_RATE = 0.001
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Set membership with no false negatives, in ``bits`` bits.
+
+    Uses the process's own ``hash()``; the filter never leaves the process.
+    """
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        h = hash(key)
+        h1, h2 = h & 0xFFFFFFFF, ((h >> 32) & 0xFFFFFFFF) | 1
+        bits = self.bits
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % bits
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        array = self._array
+        for position in self._positions(key):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def expiry_of(jwt_payload):
+    """Naive-UTC expiry of a decoded token, or None for tokens that never expire."""
+    exp = jwt_payload.get("exp")
+    if exp is None:
+        return None
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+class Blocklist:
+    def __init__(self):
+        self.refresh_seconds = DEFAULT_REFRESH_SECONDS
+        self.prune_seconds = DEFAULT_PRUNE_SECONDS
+        self.capacity = DEFAULT_CAPACITY
+        self._expiry = {}
+        self._bloom = BloomFilter(self.capacity)
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._pruner = None
+
+    def configure(self, config):
+        self.refresh_seconds = config["JWT_BLOCKLIST_REFRESH_SECONDS"]
+        self.prune_seconds = config["JWT_BLOCKLIST_PRUNE_SECONDS"]
+        self.capacity = config["JWT_BLOCKLIST_BLOOM_CAPACITY"]
+        with self._lock:
+            self._rebuild_bloom()
+
+    # -- in-memory mirror --------------------------------------------------
+
+    def _rebuild_bloom(self):
+        capacity = self.capacity
+        while capacity < len(self._expiry) * 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity)
+        for jti in self._expiry:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def _remember(self, jti, expires_at):
+        self._expiry[jti] = expires_at
+        if len(self._expiry) > self._bloom.capacity:
+            self._rebuild_bloom()
+        else:
+            self._bloom.add(jti)
+
+    def _refresh(self):
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(TokenBlocklist.id, TokenBlocklist.jti, TokenBlocklist.expires_at)
+                .where(TokenBlocklist.id > self._last_id)
+                .order_by(TokenBlocklist.id)
+            ).all()
+        with self._lock:
+            for row_id, jti, expires_at in rows:
+                self._remember(jti, expires_at)
+                self._last_id = max(self._last_id, row_id)
+
+    # -- public API --------------------------------------------------------
+
+    def is_revoked(self, jti):
+        now = time.monotonic()
+        if now - self._refreshed_at >= self.refresh_seconds:
+            self._refreshed_at = now
+            self._refresh()
+        if jti not in self._bloom:
+            return False
+        return jti in self._expiry
+
+    def revoke(self, session, jti, expires_at):
+        """Record ``jti`` as revoked; the caller commits.
+
+        Returns False if it already was, which lets token rotation detect a
+        refresh token being used twice.
+        """
+        result = session.execute(
+            insert(TokenBlocklist)
+            .values(jti=jti, expires_at=expires_at, created_at=datetime.now())
+            .on_conflict_do_nothing(index_elements=["jti"])
+        )
+        with self._lock:
+            self._remember(jti, expires_at)
+        return result.rowcount == 1
+
+    def prune(self):
+        """Drop entries for tokens that have expired (they fail validation anyway)."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        with SessionLocal() as session:
+            session.execute(delete(TokenBlocklist).where(TokenBlocklist.expires_at < now))
+            session.commit()
+        with self._lock:
+            expired = [jti for jti, expires_at in self._expiry.items() if expires_at is not None and expires_at < now]
+            if expired:
+                for jti in expired:
+                    del self._expiry[jti]
+                self._rebuild_bloom()
+        return len(expired)
+
+    def _prune_forever(self):
+        while True:
+            time.sleep(self.prune_seconds)
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Token blocklist prune failed")
+
+    def start_pruner(self):
+        if self._pruner is None:
+            self._pruner = threading.Thread(target=self._prune_forever, name="token-blocklist-pruner", daemon=True)
+            self._pruner.start()
+
+
+token_blocklist = Blocklist()
+
+
+def init_app(app):
+    token_blocklist.configure(app.config)
+    token_blocklist.start_pruner()
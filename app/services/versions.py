@@ -0,0 +1,103 @@
+"""Per-table, per-user write counters.
+
+Every flush that touches a table bumps its whole-table counter (user 0) and
+the counter of each affected owner, inside the same transaction. Readers use
+the counters as cheap change detectors (ETags, cache keys) without querying
+the tables themselves.
+"""
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..db import SessionLocal
+from ..models import TableVersion
+
+ALL_USERS = 0
+
+
+def bump(connection, table_name, user_ids=()):
+    """Increment the counters for ``table_name`` (and each of ``user_ids``).
+
+    Returns the new whole-table version.
+    """
+    keys = {ALL_USERS} | {int(u) for u in user_ids if u is not None}
+    stmt = insert(TableVersion.__table__).values(
+        [{"table_name": table_name, "user_id": u, "version": 1} for u in sorted(keys)]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["table_name", "user_id"],
+        set_={"version": TableVersion.__table__.c.version + 1},
+    ).returning(TableVersion.__table__.c.user_id, TableVersion.__table__.c.version)
+    return dict(connection.execute(stmt).all())[ALL_USERS]
+
+
+def current_versions(session, table_names, user_id=ALL_USERS):
+    """``{table_name: version}`` for one scope (a user, or ALL_USERS)."""
+    rows = session.execute(
+        select(TableVersion.table_name, TableVersion.version).where(
+            TableVersion.table_name.in_(table_names),
+            TableVersion.user_id == user_id,
+        )
+    ).all()
+    found = dict(rows)
+    return {name: found.get(name, 0) for name in table_names}
+
+
+def _touched(session):
+    touched = {}
+    for obj in session.new | session.deleted:
+        touched.setdefault(obj.__tablename__, set()).add(getattr(obj, "user_id", None))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            touched.setdefault(obj.__tablename__, set()).add(getattr(obj, "user_id", None))
+    touched.pop(TableVersion.__tablename__, None)
+    return touched
+
+
+_commit_listeners = []
+
+
+def on_commit(callback):
+    """Register ``callback({table_name: user_ids})`` to run after each commit that wrote rows."""
+    _commit_listeners.append(callback)
+    return callback
+
+
+def record_write(session, table_name, user_ids=()):
+    """Bump counters for writes the flush hook cannot see (Core/bulk statements).
+
+    ``session.info["version_spans"]`` keeps ``{table_name: [before, after]}``,
+    the whole-table version before this transaction's first bump and after
+    its last, for after-commit hooks that want to tell their own writes
+    from other processes'.
+    """
+    version = bump(session.connection(), table_name, user_ids)
+    span = session.info.setdefault("version_spans", {}).setdefault(table_name, [version - 1, version])
+    span[1] = version
+    pending = session.info.setdefault("touched_tables", {})
+    pending.setdefault(table_name, set()).update(user_ids)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _bump_flushed_tables(session, flush_context):
+    for table_name, user_ids in _touched(session).items():
+        record_write(session, table_name, user_ids)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _notify_commit(session):
+    touched = session.info.pop("touched_tables", None)
+    if not touched:
+        return
+    for callback in _commit_listeners:
+        callback(touched)
+
+
+@event.listens_for(SessionLocal, "after_begin")
+def _reset_spans(session, transaction, connection):
+    session.info.pop("version_spans", None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("touched_tables", None)
+    session.info.pop("version_spans", None)
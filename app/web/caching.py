@@ -0,0 +1,95 @@
+import hashlib
+from functools import wraps
+
+from flask import make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from ..db import Base, db_session
+from ..db.scoping import wants_all_users
+from ..services.cache import response_cache
+from ..services.versions import ALL_USERS, current_versions, on_commit
+
+
+def _scope_user_id(per_user):
+    if not per_user or wants_all_users():
+        return ALL_USERS
+    return int(get_jwt_identity())
+
+
+def _table_scope(table_name, scope_user_id):
+    """Tables without an owner column only have the whole-table counter."""
+    if "user_id" in Base.metadata.tables[table_name].c:
+        return scope_user_id
+    return ALL_USERS
+
+
+def compute_etag(tables, scope_user_id):
+    """Strong ETag from the table counters plus everything that shapes the body."""
+    owned = [t for t in tables if _table_scope(t, scope_user_id) != ALL_USERS]
+    shared = [t for t in tables if t not in owned]
+    versions = {}
+    if owned:
+        versions.update(current_versions(db_session, owned, scope_user_id))
+    if shared:
+        versions.update(current_versions(db_session, shared, ALL_USERS))
+    parts = [
+        request.full_path,
+        str(get_jwt_identity()),
+        request.headers.get("Accept", ""),
+        *(f"{name}:{versions[name]}" for name in tables),
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def cache_tags(table_name, user_ids):
+    return [f"{table_name}:{ALL_USERS}"] + [f"{table_name}:{u}" for u in user_ids if u is not None]
+
+
+@on_commit
+def _invalidate_written_tables(touched):
+    tags = []
+    for table_name, user_ids in touched.items():
+        tags += cache_tags(table_name, user_ids)
+    response_cache.invalidate_tags(tags)
+
+
+def cached_get(*tables, per_user=False):
+    """Conditional + cached GET for views built from ``tables``.
+
+    A matching ``If-None-Match`` gets a 304 and a cached body is replayed,
+    both before the view queries anything. The ETag doubles as the cache key,
+    and it embeds the table counters, so a write anywhere makes old entries
+    unreachable; commits also evict them eagerly by tag. ``per_user`` uses the
+    caller's own counters for owner-scoped tables. Must sit below
+    ``jwt_required`` so the identity is available.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            scope_user_id = _scope_user_id(per_user)
+            etag = compute_etag(tables, scope_user_id)
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+                response.set_etag(etag)
+                return response
+
+            cached = response_cache.get(etag)
+            if cached is not None:
+                body, status, mimetype = cached
+                response = make_response(body, status)
+                response.mimetype = mimetype
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    tags = [f"{name}:{_table_scope(name, scope_user_id)}" for name in tables]
+                    response_cache.set(etag, (response.get_data(), 200, response.mimetype), tags)
+
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    response_cache.configure(app.config)
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from flask import Response, jsonify, request, stream_with_context
+
+from ..db.scoping import requested_date_range, requested_owner_id
+from ..services.exports import XLSX_MIMETYPE, ExportFormatUnavailable, iter_csv, iter_xlsx
+
+
+def export_filters():
+    """``(owner_id, date_from, date_to)`` from the query string; ``to`` is exclusive."""
+    return (requested_owner_id(), *requested_date_range())
+
+
+def export_response(stmt, basename):
+    """Stream ``stmt`` as CSV (default) or XLSX (``?format=xlsx``) as a download."""
+    export_format = request.args.get("format", "csv")
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    if export_format == "xlsx":
+        try:
+            body = iter_xlsx(stmt, sheet_title=basename)
+        except ExportFormatUnavailable as e:
+            return jsonify({"msg": str(e)}), 501
+        mimetype, extension = XLSX_MIMETYPE, "xlsx"
+    elif export_format == "csv":
+        body, mimetype, extension = iter_csv(stmt), "text/csv", "csv"
+    else:
+        return jsonify({"msg": "format must be csv or xlsx"}), 400
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{basename}_{stamp}.{extension}"'},
+    )
@@ -0,0 +1,75 @@
+from flask import Response, current_app, request, stream_with_context
+
+from ..db import SessionLocal
+from ..db.pagination import apply_keyset
+from ..db.projection import Projection, projected_select
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+
+def prefers_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def wants_stream():
+    """True for ``Accept: application/x-ndjson`` or ``?stream=1``."""
+    return request.args.get("stream") in ("1", "true") or prefers_ndjson()
+
+
+def iter_partitions(stmt, size=STREAM_BATCH_SIZE):
+    """Yield lists of result rows, ``size`` at a time.
+
+    Runs on its own session: the response body is produced after the view
+    returns, so the request-scoped session may already be gone.
+    """
+    with SessionLocal() as session:
+        result = session.execute(stmt.execution_options(yield_per=size))
+        for partition in result.partitions():
+            yield partition
+
+
+def _iter_batches(stmt, fields):
+    to_dict = Projection.serializer(fields)
+    for partition in iter_partitions(stmt):
+        yield [to_dict(row) for row in partition]
+
+
+def _ndjson_body(batches):
+    dumps = current_app.json.dumps
+    for batch in batches:
+        yield "".join(dumps(row) + "\n" for row in batch)
+
+
+def _json_body(collection, batches):
+    """The regular ``{collection: [...], next_cursor: null}`` envelope, chunked."""
+    dumps = current_app.json.dumps
+    yield '{"%s":[' % collection
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        chunk = ",".join(dumps(row) for row in batch)
+        yield chunk if first else "," + chunk
+        first = False
+    yield '],"next_cursor":null}'
+
+
+def stream_collection(collection, model, *order_columns, scope=None):
+    """Stream every row of a list endpoint instead of one page.
+
+    Honors ``fields`` and ``cursor`` like the paged response; ``limit`` is
+    ignored. NDJSON when asked for via Accept or ``format=ndjson``,
+    otherwise the usual JSON envelope sent in chunks.
+    """
+    stmt, fields = projected_select(model, *order_columns, scope=scope)
+    stmt = apply_keyset(stmt, order_columns, request.args.get("cursor") or None)
+    batches = _iter_batches(stmt, fields)
+
+    if prefers_ndjson():
+        body, mimetype = _ndjson_body(batches), NDJSON_MIMETYPE
+    else:
+        body, mimetype = _json_body(collection, batches), "application/json"
+    return Response(stream_with_context(body), mimetype=mimetype)
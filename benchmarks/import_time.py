@@ -0,0 +1,81 @@
+"""Cold-start benchmark: ``import app`` and ``create_app()`` in fresh interpreters.
+
+    python benchmarks/import_time.py [--runs 10] [--top 15]
+
+Each run is a new Python process, so nothing is cached in ``sys.modules``.
+The database is a throwaway SQLite file: the first run creates the schema
+and the rest measure the steady state (schema version already recorded).
+With ``--top`` the slowest modules of one run are listed from
+``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1}))
+"""
+
+
+def run_once(env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app; app.create_app()"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), module.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}", NAME_INDEX_WARM="0")
+        first = run_once(env)
+        runs = [run_once(env) for _ in range(args.runs)]
+
+        print(f"first run (creates schema): import {first['import'] * 1000:.0f} ms, "
+              f"create_app {first['create_app'] * 1000:.0f} ms")
+        for phase in ("import", "create_app"):
+            times = [r[phase] * 1000 for r in runs]
+            print(f"{phase:>10}: median {statistics.median(times):.0f} ms, "
+                  f"min {min(times):.0f} ms, max {max(times):.0f} ms ({args.runs} runs)")
+        total = [(r["import"] + r["create_app"]) * 1000 for r in runs]
+        print(f"{'total':>10}: median {statistics.median(total):.0f} ms")
+
+        if args.top:
+            print(f"\nslowest imports (cumulative):")
+            for microseconds, module in slowest_imports(env, args.top):
+                print(f"  {microseconds / 1000:8.1f} ms {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,94 @@
 import os
+from datetime import timedelta
 
 class Config:
-    DATABASE_URL = "sqlite:///mycologger.db"
+    DATABASE_URL = os.environ.get("DATABASE_URL") or "sqlite:///mycologger.db"
     SECRET_KEY = os.environ.get("SECRET_KEY") or "supersecretkey"
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or "jwtsecretkey"
+
+    # Short-lived access tokens, renewed through /api/auth/refresh with a
+    # rotating refresh token instead of logging in again
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get("JWT_ACCESS_TOKEN_MINUTES") or 15))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get("JWT_REFRESH_TOKEN_DAYS") or 30))
+
+    # Users resolved by login and by current_user, keyed by id and username
+    IDENTITY_CACHE_MAXSIZE = int(os.environ.get("IDENTITY_CACHE_MAXSIZE") or 4096)
+    IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL") or 60)
+
+    # Password hashing runs in a process pool; 0 workers hashes inline.
+    # Beyond HASH_POOL_MAX_PENDING concurrent hashes (default 4 per worker)
+    # login/register answer 503 with Retry-After.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "scrypt"
+    HASH_POOL_WORKERS = int(os.environ.get("HASH_POOL_WORKERS") or max(1, (os.cpu_count() or 2) // 2))
+    HASH_POOL_MAX_PENDING = int(os.environ.get("HASH_POOL_MAX_PENDING") or 0)
+    HASH_POOL_RETRY_AFTER = int(os.environ.get("HASH_POOL_RETRY_AFTER") or 1)
+
+    # Revoked tokens: how often each worker picks up other workers' logouts,
+    # and how often expired entries are pruned
+    JWT_BLOCKLIST_REFRESH_SECONDS = float(os.environ.get("JWT_BLOCKLIST_REFRESH_SECONDS") or 1)
+    JWT_BLOCKLIST_PRUNE_SECONDS = int(os.environ.get("JWT_BLOCKLIST_PRUNE_SECONDS") or 600)
+    JWT_BLOCKLIST_BLOOM_CAPACITY = int(os.environ.get("JWT_BLOCKLIST_BLOOM_CAPACITY") or 100000)
+
+    # Engine / connection pool
+    SQLALCHEMY_ECHO = os.environ.get("SQLALCHEMY_ECHO") == "1"
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE") or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW") or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT") or 30)
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE") or 3600)
+
+    # SQLite pragmas, applied to every new connection
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE") or "WAL"
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS") or "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS") or 5000)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB") or 65536)
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE") or 268435456)
+
+    # GET response cache; "sqlite" adds a tier shared by all workers on the host
+    RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+    RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND") or "memory"
+    RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH") or "response_cache.db"
+    RESPONSE_CACHE_MAXSIZE = int(os.environ.get("RESPONSE_CACHE_MAXSIZE") or 1024)
+    RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL") or 60)
+
+    # "did you mean" matching for vendor and raw-material names
+    NAME_INDEX_WARM = os.environ.get("NAME_INDEX_WARM", "1") == "1"
+    NAME_INDEX_REFRESH_SECONDS = float(os.environ.get("NAME_INDEX_REFRESH_SECONDS") or 5)
+    NAME_SUGGEST_THRESHOLD = float(os.environ.get("NAME_SUGGEST_THRESHOLD") or 0.3)
+
+    # Receipt object storage (Cloudflare R2). STORAGE_ENDPOINT_URL overrides
+    # the R2 endpoint, e.g. to test against moto or minio.
+    STORAGE_ACCOUNT_ID = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
+    STORAGE_ACCESS_KEY_ID = os.environ.get("CLOUDFLARE_ACCESS_KEY_ID")
+    STORAGE_SECRET_ACCESS_KEY = os.environ.get("CLOUDFLARE_SECRET_ACCESS_KEY")
+    STORAGE_BUCKET = os.environ.get("CLOUDFLARE_BUCKET")
+    STORAGE_ENDPOINT_URL = os.environ.get("STORAGE_ENDPOINT_URL") or os.environ.get("S3_ENDPOINT_URL")
+    STORAGE_MAX_POOL_CONNECTIONS = int(os.environ.get("STORAGE_MAX_POOL_CONNECTIONS") or 32)
+    # DeleteObjects batches (1000 keys each) sent at once by bulk deletes
+    STORAGE_DELETE_WORKERS = int(os.environ.get("STORAGE_DELETE_WORKERS") or 8)
+
+    # Receipt uploads: presigned URL lifetime, batch signing limit, and
+    # multipart part size (S3/R2 need at least 5 MiB for all but the last part)
+    RECEIPT_UPLOAD_URL_TTL = int(os.environ.get("RECEIPT_UPLOAD_URL_TTL") or 300)
+    RECEIPT_PRESIGN_BATCH_MAX = int(os.environ.get("RECEIPT_PRESIGN_BATCH_MAX") or 100)
+    RECEIPT_MULTIPART_PART_SIZE = int(os.environ.get("RECEIPT_MULTIPART_PART_SIZE") or 8 * 1024 * 1024)
+
+    # Receipt previews: longest side in px, WebP/JPEG quality, render processes
+    # (0 renders in the I/O threads) and the largest original worth fetching
+    THUMBNAILS_ENABLED = os.environ.get("THUMBNAILS_ENABLED", "1") == "1"
+    THUMBNAIL_MAX_SIZE = int(os.environ.get("THUMBNAIL_MAX_SIZE") or 320)
+    THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY") or 75)
+    THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS") or 2)
+    THUMBNAIL_MAX_SOURCE_BYTES = int(os.environ.get("THUMBNAIL_MAX_SOURCE_BYTES") or 40 * 1024 * 1024)
+
+    # Background jobs: where workers run (thread | process | off), how many,
+    # idle poll interval, lease length, retry backoff and how long finished
+    # jobs are kept
+    JOB_WORKER_MODE = os.environ.get("JOB_WORKER_MODE", "thread")
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS") or 2)
+    JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS") or 1.0)
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS") or 300)
+    JOB_BACKOFF_SECONDS = float(os.environ.get("JOB_BACKOFF_SECONDS") or 5)
+    JOB_BACKOFF_MAX_SECONDS = float(os.environ.get("JOB_BACKOFF_MAX_SECONDS") or 3600)
+    JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS") or 86400)
+
+    BULK_IMPORT_MAX_ROWS = int(os.environ.get("BULK_IMPORT_MAX_ROWS") or 5000)
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+import pytest
+
+# the engine is built from Config at import time, so point it at a scratch
+# database before anything imports the app
+_db_dir = tempfile.mkdtemp(prefix="mycologger-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("JOB_WORKER_MODE", "off")
+os.environ.setdefault("NAME_INDEX_WARM", "0")
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
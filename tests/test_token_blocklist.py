@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+
+from app.db import SessionLocal
+from app.services.token_blocklist import Blocklist
+
+
+def test_revocations_after_prune_reach_other_workers(app):
+    a, b = Blocklist(), Blocklist()
+    b.refresh_seconds = 0
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    past = now - timedelta(hours=1)
+    with SessionLocal() as session:
+        a.revoke(session, "expired-1", past)
+        a.revoke(session, "expired-2", past)
+        session.commit()
+    assert b.is_revoked("expired-2")
+
+    # pruning the newest rows must not let SQLite hand their ids out again,
+    # or b would skip the next revocation as already seen
+    a.prune()
+    with SessionLocal() as session:
+        a.revoke(session, "fresh-logout", now + timedelta(hours=1))
+        session.commit()
+
+    assert b.is_revoked("fresh-logout")